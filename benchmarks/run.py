@@ -0,0 +1,149 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+""" Offline benchmarks of discovery and download, run against the local
+stand-in server of benchmarks.server. From the repository root:
+
+    python -m benchmarks.run --videos 40 --latency 0.05 --jobs 1 4 8
+"""
+
+
+from __future__ import annotations
+from argparse import ArgumentParser, Namespace
+from json import dumps as json_dumps
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from unimi_dl import cmd
+from unimi_dl.hls import HLSDownloader, mount_pool
+from unimi_dl.ledger import Ledger
+from unimi_dl.platform import ariel, getPlatform, panopto
+
+from .server import Config, Server
+
+
+def get_args() -> Namespace:
+    parser = ArgumentParser(description="unimi-dl offline benchmarks")
+    parser.add_argument("--videos", type=int, default=40,
+                        help="videos linked by the course page (default: 40)")
+    parser.add_argument("--segments", type=int, default=30,
+                        help="segments of each video (default: 30)")
+    parser.add_argument("--segment-size", type=int, default=256 * 1024,
+                        help="bytes of each segment of the highest variant (default: 262144)")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds added to every response (default: 0.02)")
+    parser.add_argument("--bandwidth", type=int, default=0,
+                        help="bytes/s of each connection, 0 for unlimited (default: 0)")
+    parser.add_argument("--download-videos", type=int, default=8,
+                        help="videos downloaded by the download benchmarks (default: 8)")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4],
+                        help="values of --jobs to benchmark (default: 1 4)")
+    parser.add_argument("--segment-jobs", type=int, default=4,
+                        help="value of --segment-jobs for the native engine (default: 4)")
+    parser.add_argument("--engines", nargs="+", default=["native"], choices=["native", "youtube-dl"],
+                        help="download engines to benchmark (default: native)")
+    parser.add_argument("--json", metavar="PATH", type=str,
+                        help="also write the results as json to PATH")
+    return parser.parse_args()
+
+
+def measure(function: Callable, *args) -> tuple[Any, float, int]:
+    """ Returns the result of {function} called with {args}, the seconds
+    it took and the peak of memory allocated meanwhile """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def time_to_first(iterator) -> float:
+    start = time.perf_counter()
+    next(iter(iterator), None)
+    return time.perf_counter() - start
+
+
+def bench_download(platform, manifests: dict[str, str], engine: str, jobs: int, segment_jobs: int) -> dict:
+    with tempfile.TemporaryDirectory() as output:
+        hls_downloader = None
+        if engine == "native":
+            mount_pool(platform.session, jobs * segment_jobs)
+            hls_downloader = HLSDownloader(platform.session, segment_jobs)
+        with Ledger(os.path.join(output, "downloaded.db")) as ledger:
+            _, elapsed, peak = measure(cmd.download, output, manifests.items(), ledger,
+                                       False, False, jobs, hls_downloader)
+        size = sum(entry.stat().st_size for entry in os.scandir(output)
+                   if not entry.name.startswith("downloaded.db"))
+    return {"seconds": elapsed, "bytes": size, "bytes/s": size / elapsed, "peak memory": peak}
+
+
+def main() -> None:
+    opts = get_args()
+    logging.basicConfig(level=logging.ERROR)
+    config = Config(opts.videos, opts.segments,
+                    opts.segment_size, opts.latency, opts.bandwidth)
+    results = {}
+    with Server(config) as server:
+        ariel.LOGIN_URL = f"{server.url}/login"
+        panopto.AUTH_URL = f"{server.url}/panopto/auth"
+        course_url = f"{server.url}/ariel/course"
+
+        platform, results["ariel login"], _ = measure(
+            getPlatform, "user", "password", "ariel")
+        manifests, elapsed, peak = measure(
+            platform.get_manifests, course_url)
+        results["ariel discovery"] = {"seconds": elapsed, "peak memory": peak, "videos": len(manifests),
+                                      "first manifest": time_to_first(platform.iter_manifests(course_url))}
+
+        panopto_platform = getPlatform("user", "password", "panopto")
+        pages = [("panopto", f"{server.url}/panopto/session/{i}")
+                 for i in range(opts.videos)]
+        found, elapsed, peak = measure(lambda: dict(cmd.iter_all_manifests(
+            {"panopto": panopto_platform}, pages, min(len(pages), 16))))
+        results["panopto discovery"] = {
+            "seconds": elapsed, "peak memory": peak, "videos": len(found)}
+        folder_url = f"{server.url}/Panopto/Pages/Sessions/List.aspx#folderID=%22{'0' * 8}-{'0' * 4}-{'0' * 4}-{'0' * 4}-{'0' * 12}%22"
+        found, elapsed, peak = measure(
+            panopto_platform.get_manifests, folder_url)
+        results["panopto folder discovery"] = {
+            "seconds": elapsed, "peak memory": peak, "videos": len(found)}
+
+        to_download = dict(list(manifests.items())[:opts.download_videos])
+        for engine in opts.engines:
+            for jobs in opts.jobs:
+                results[f"download {engine} jobs={jobs}"] = bench_download(
+                    platform, to_download, engine, jobs, opts.segment_jobs)
+
+    for name, result in results.items():
+        if isinstance(result, float):
+            result = {"seconds": result}
+        print(f"{name:<32}" + "  ".join(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}"
+                                        for key, value in result.items()))
+    if opts.json:
+        with open(opts.json, "w") as json_file:
+            json_file.write(json_dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
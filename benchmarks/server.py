@@ -0,0 +1,200 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+""" Local stand-in for the Ariel and Panopto hosts and their HLS CDN.
+
+Routes:
+    POST /login                         Ariel login form, sets a cookie
+    GET  /panopto/auth                  Panopto login, sets a cookie
+    GET  /ariel/course                  course page linking every video
+    GET  /panopto/session/<i>           page embedding the iframe of video i
+    GET  /panopto/embed/<i>             iframe page with the VideoUrl of video i
+    POST /Panopto/Services/Data.svc/GetSessions
+                                        paginated list of the sessions of the folder
+    POST /Panopto/Pages/Viewer/DeliveryInfo.aspx
+                                        delivery info of a session, with its stream
+    GET  /vod/mp4:course/<name>.mp4/... master and media playlists, segments
+"""
+
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps as json_dumps, loads as json_loads
+import re
+import urllib.parse
+import threading
+import time
+
+
+class Config:
+    def __init__(self, videos: int = 40, segments: int = 30, segment_size: int = 256 * 1024,
+                 latency: float = 0.0, bandwidth: int = 0, filler: int = 2000) -> None:
+        """ {latency} is added to every response (seconds), {bandwidth}
+        limits each connection (bytes/s, 0 for unlimited), and {filler}
+        bytes of markup surround every link of the course page """
+
+        self.videos = videos
+        self.segments = segments
+        self.segment_size = segment_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.filler = filler
+
+
+_video_re = re.compile(r"^/vod/mp4:course/(?P<name>[^/]+)\.mp4/(?P<file>[^/]+)$")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: Config = Config()
+
+    def log_message(self, *_) -> None:
+        pass
+
+    @property
+    def base(self) -> str:
+        return f"http://{self.headers['Host']}"
+
+    def send(self, body: bytes, content_type: str = "text/html; charset=utf-8", headers: dict[str, str] = {}) -> None:
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        if not self.config.bandwidth:
+            self.wfile.write(body)
+            return
+        chunk = max(self.config.bandwidth // 20, 1)
+        for start in range(0, len(body), chunk):
+            self.wfile.write(body[start:start + chunk])
+            time.sleep(len(body[start:start + chunk]) / self.config.bandwidth)
+
+    def not_found(self) -> None:
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/login":
+            self.send(b"ok", headers={"Set-Cookie": "ariel=1; Path=/"})
+        elif self.path == "/Panopto/Services/Data.svc/GetSessions":
+            query = json_loads(body)["queryParameters"]
+            start = query["page"] * query["maxResults"]
+            results = [{"DeliveryID": str(i), "SessionName": f"Lezione {i}"}
+                       for i in range(start, min(start + query["maxResults"], self.config.videos))]
+            self.send(json_dumps({"d": {"Results": results, "TotalNumber": self.config.videos}}).encode(),
+                      "application/json")
+        elif self.path == "/Panopto/Pages/Viewer/DeliveryInfo.aspx":
+            i = urllib.parse.parse_qs(body.decode())["deliveryId"][0]
+            url = f"{self.base}/vod/mp4:course/Lezione_{i}.mp4/manifest.m3u8"
+            self.send(json_dumps({"Delivery": {"SessionName": f"Lezione {i}", "PodcastStreams": [{"StreamUrl": url}]}}).encode(),
+                      "application/json")
+        else:
+            self.not_found()
+
+    def do_HEAD(self) -> None:
+        self.do_GET()
+
+    def do_GET(self) -> None:
+        config = self.config
+        if self.path == "/panopto/auth":
+            self.send(b"ok", headers={"Set-Cookie": "panopto=1; Path=/"})
+        elif self.path == "/ariel/course":
+            filler = "<p>" + "x" * config.filler + "</p>\n"
+            links = "".join(f"{filler}<a href=\"{self.base}/vod/mp4:course/Lezione_{i}.mp4/manifest.m3u8\">{i}</a>\n"
+                            for i in range(config.videos))
+            self.send(f"<html><body>{links}</body></html>".encode())
+        elif self.path.startswith("/panopto/session/"):
+            i = self.path.rsplit("/", 1)[1]
+            self.send(
+                f"<html><iframe src=\"{self.base}/panopto/embed/{i}\"></iframe></html>".encode())
+        elif self.path.startswith("/panopto/embed/"):
+            i = self.path.rsplit("/", 1)[1]
+            url = f"{self.base}/vod/mp4:course/Lezione_{i}.mp4/manifest.m3u8".replace(
+                "/", "\\/")
+            self.send(
+                f"<html><title>Lezione {i}</title><script>{{\"VideoUrl\":\"{url}\"}}</script></html>".encode())
+        else:
+            match = _video_re.match(self.path)
+            if not match:
+                self.not_found()
+            elif match["file"] == "manifest.m3u8":
+                self.send(self.master().encode(), "application/vnd.apple.mpegurl")
+            elif match["file"].startswith("chunklist_"):
+                variant = match["file"][len("chunklist_"):-len(".m3u8")]
+                self.send(self.media(variant).encode(),
+                          "application/vnd.apple.mpegurl")
+            elif match["file"].startswith("media_"):
+                variant, index = match["file"][len(
+                    "media_"):-len(".ts")].split("_")
+                self.send(self.segment(variant, int(index)), "video/MP2T")
+            else:
+                self.not_found()
+
+    def master(self) -> str:
+        return "\n".join([
+            "#EXTM3U",
+            "#EXT-X-STREAM-INF:BANDWIDTH=400000,RESOLUTION=640x360,CODECS=\"avc1.4d401e,mp4a.40.2\"",
+            "chunklist_360.m3u8",
+            "#EXT-X-STREAM-INF:BANDWIDTH=1600000,RESOLUTION=1280x720,CODECS=\"avc1.4d401f,mp4a.40.2\"",
+            "chunklist_720.m3u8",
+            ""])
+
+    def media(self, variant: str) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3",
+                 "#EXT-X-TARGETDURATION:10", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(self.config.segments):
+            lines += ["#EXTINF:10.0,", f"media_{variant}_{i}.ts"]
+        lines += ["#EXT-X-ENDLIST", ""]
+        return "\n".join(lines)
+
+    def segment(self, variant: str, index: int) -> bytes:
+        # lower variants are proportionally smaller, like real ones
+        size = self.config.segment_size // (4 if variant == "360" else 1)
+        # MPEG-TS packets: sync byte followed by filler
+        packet = bytes([0x47]) + bytes([index % 256]) * 187
+        return (packet * (size // 188 + 1))[:size]
+
+
+class Server:
+    """ Runs the stand-in on a free local port in a background thread. """
+
+    def __init__(self, config: Config) -> None:
+        handler = type("ConfiguredHandler", (Handler,), {"config": config})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> Server:
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,91 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+""" Startup time of the CLI modes which don't download anything.
+From the repository root:
+
+    python -m benchmarks.startup
+
+Exits with an error if any of those modes imports a heavy module,
+so that it can be used as a regression check.
+"""
+
+
+from __future__ import annotations
+from argparse import ArgumentParser
+from json import dumps as json_dumps, loads as json_loads
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["requests", "urllib3", "youtube_dl"]
+
+MODES = {
+    "--help": ["--help"],
+    "--version": ["--version"],
+    "--cleanup-downloaded": ["--cleanup-downloaded"],
+    "--wipe-credentials": ["--wipe-credentials", "-c", "missing.json"],
+}
+
+# runs the CLI, then reports which heavy modules it imported
+PROBE = """
+import json, sys
+heavy = json.loads(sys.argv[2])
+sys.argv = ["unimi-dl"] + json.loads(sys.argv[1])
+from unimi_dl.cmd import main
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps([module for module in heavy if module in sys.modules]))
+"""
+
+
+def run(args: list[str], home: str) -> tuple[float, list[str]]:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", PROBE, json_dumps(args), json_dumps(HEAVY_MODULES)],
+                            input="\n", capture_output=True, text=True, cwd=home, env={"HOME": home, "PYTHONPATH": ROOT})
+    elapsed = time.perf_counter() - start
+    return elapsed, json_loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = ArgumentParser(description="unimi-dl startup benchmark")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="runs of each mode (default: 10)")
+    opts = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as home:
+        for name, args in MODES.items():
+            times = []
+            for _ in range(opts.runs):
+                elapsed, imported = run(args, home)
+                times.append(elapsed)
+            print(f"{name:<24}median: {statistics.median(times) * 1000:.1f} ms  "
+                  f"min: {min(times) * 1000:.1f} ms  heavy imports: {imported or 'none'}")
+            failed = failed or bool(imported)
+    if failed:
+        sys.exit("Some modes import heavy modules they don't need")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,13 @@
 __version__ = "0.3.1"
 __license__ = "GPL v.3"
 
-import unimi_dl.platform
+__all__ = ["Client", "cmd"]
 
-__all__ = ["cmd"]
+
+def __getattr__(name: str):
+    # the client depends on requests, which the CLI imports only when
+    # it needs it: importing the package mustn't pay for it
+    if name == "Client":
+        from .client import Client
+        return Client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,147 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+from typing import Iterable
+
+from requests import Session
+
+from .cmd import download_video, iter_all_manifests, update_cookies
+from .hls import HLSDownloader, VariantSelector, mount_pool
+from .ledger import Ledger
+from .platform import PageCache, SessionCache, getPlatform
+from .platform.platform import Platform
+from .retry import REQUEST_TIMEOUT
+from .throttle import TokenBucket
+
+
+class Client:
+    """ Library entry point for discovering and downloading the videos
+    available to an account, which never prompts nor exits: errors are
+    raised, or set on the returned futures.
+    The logged in platforms, the download session and the pool of
+    {jobs} download workers are kept across calls, until {close}.
+
+        with Client(email, password, output="lectures") as client:
+            videos = client.discover([course_url])
+            for filename, future in client.download(videos).items():
+                print(filename, future.result())
+
+    Downloads use the built-in HLS downloader, or youtube-dl if {engine}
+    is "youtube-dl". If {ledger_path} is given, the downloaded videos are
+    recorded there and not downloaded again. If {cache_dir} is given,
+    the login sessions and the pages are cached there. """
+
+    def __init__(self, email: str, password: str, output: str = ".", jobs: int = 4, segment_jobs: int = 4,
+                 engine: str = "native", ledger_path: str | None = None, cache_dir: str | None = None,
+                 selector: VariantSelector | None = None, max_rate: int | None = None) -> None:
+        self.email = email
+        self.password = password
+        self.output = output
+        self.jobs = jobs
+        self.max_rate = max_rate
+        self.platforms = {}
+        self.lock = threading.Lock()
+        self.ledger = Ledger(ledger_path) if ledger_path else None
+        self.session_cache = SessionCache(os.path.join(
+            cache_dir, "sessions.json")) if cache_dir else None
+        self.page_cache = PageCache(os.path.join(
+            cache_dir, "pages.db")) if cache_dir else None
+        self.selector = selector or VariantSelector()
+        self.hls_downloader = None
+        if engine == "native":
+            session = Session()
+            mount_pool(session, jobs * segment_jobs)
+            self.hls_downloader = HLSDownloader(session, segment_jobs,
+                                                TokenBucket(max_rate) if max_rate else None, selector=self.selector)
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def platform(self, name: str) -> Platform:
+        """ Returns the platform {name} ("ariel" or "panopto"), logging
+        in the first time it's needed """
+
+        with self.lock:
+            if name not in self.platforms:
+                self.platforms[name] = getPlatform(
+                    self.email, self.password, name, self.session_cache, self.page_cache)
+            return self.platforms[name]
+
+    def discover(self, urls: Iterable[str], platform: str = "ariel") -> dict[str, str]:
+        """ Returns the {filename: manifest} of the videos found at
+        {urls} of {platform}. Pages which can't be fetched are skipped """
+
+        pages = [(platform, url) for url in urls]
+        if not pages:
+            return {}
+        return dict(iter_all_manifests({platform: self.platform(platform)}, pages, min(len(pages), 16)))
+
+    def download(self, items: dict[str, str] | Iterable[tuple[str, str]], output: str | None = None) -> dict[str, Future]:
+        """ Starts downloading the {filename: manifest} {items} into
+        {output}, by default the output directory of the client, and
+        returns their {filename: future}. Each future results in the
+        path of the downloaded file, or in None if the video had already
+        been downloaded """
+
+        output = output or self.output
+        if not os.access(output, os.W_OK):
+            raise PermissionError(f"Can't write to directory {output}")
+        if isinstance(items, dict):
+            items = items.items()
+        if self.hls_downloader:
+            with self.lock:
+                update_cookies(self.hls_downloader.session, self.platforms)
+        ydl_extra = {"format": self.selector.format(),
+                     "socket_timeout": REQUEST_TIMEOUT[1]}
+        futures = {}
+        for filename, manifest in items:
+            if self.ledger is not None and manifest in self.ledger:
+                future = Future()
+                future.set_result(None)
+            else:
+                future = self.executor.submit(
+                    self.download_one, filename, manifest, output, ydl_extra)
+            futures[filename] = future
+        return futures
+
+    def download_one(self, filename: str, manifest: str, output: str, ydl_extra: dict) -> str | None:
+        path = download_video(manifest, os.path.join(output, filename), self.hls_downloader,
+                              self.max_rate and self.max_rate // self.jobs, ydl_extra)
+        # recorded before the future completes, so that a following
+        # call can't download it again
+        if self.ledger is not None:
+            self.ledger.add(manifest, filename)
+        return path
+
+    def close(self) -> None:
+        """ Waits for the downloads started and releases the resources
+        of the client """
+
+        self.executor.shutdown(wait=True)
+        if self.ledger is not None:
+            self.ledger.close()
+        if self.page_cache:
+            self.page_cache.close()
+
+    def __enter__(self) -> Client:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -18,24 +18,52 @@
 
 from __future__ import annotations
 from argparse import ArgumentParser, Namespace
-from datetime import datetime
+import atexit
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 from getpass import getpass
-from io import TextIOWrapper
+import hashlib
 from json import dumps as json_dumps, load as json_load
 from json.decoder import JSONDecodeError
 import logging
 import os
 from pathlib import Path
 import platform as pt
+from queue import Queue
+import random
 import sys
-
-from requests import __version__ as reqv
-import youtube_dl
-from youtube_dl.version import __version__ as ytdv
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator
 
 from . import __version__ as udlv
+from .download_queue import DownloadQueue
+from .ledger import Ledger
+from .metrics import metrics
 from .multi_select import WrongSelectionError, multi_select
-from .platform import getPlatform
+from .output_index import OutputIndex
+from .postprocess import ENCODERS, PostProcessError, PostProcessor
+from .retry import REQUEST_TIMEOUT, retrier
+from .throttle import ConcurrencyController, TokenBucket, format_size, parse_rate
+
+# requests, youtube_dl and the modules depending on them are imported
+# only by the code paths using them, so that the modes which don't need
+# them (--help, --version, --cleanup-downloaded...) start quickly
+if TYPE_CHECKING:
+    from multiprocessing.synchronize import Semaphore
+
+    from requests import Session
+
+    from .hls import HLSDownloader, MediaPlaylist, Variant
+    from .platform import SessionCache
+    from .platform.platform import Platform
+
+# set when the user interrupts the downloads, so that the youtube-dl
+# ones in progress stop too
+_stopping = threading.Event()
+# minimum seconds between the logins of a platform in watch mode
+WATCH_RELOGIN_INTERVAL = 600
 
 
 def get_data_dir() -> Path:
@@ -62,8 +90,10 @@ def get_args(local: str) -> Namespace:
     parser = ArgumentParser(
         description=f"Unimi material downloader v. {udlv}")
     if not set(["--cleanup-downloaded", "--wipe-credentials"]) & set(sys.argv):
-        parser.add_argument("url", metavar="URL", type=str,
-                            help="URL of the video(s) to download")
+        parser.add_argument("url", metavar="URL", type=str, nargs="*",
+                            help="URL(s) of the video(s) to download")
+    parser.add_argument("-b", "--batch", metavar="FILE", type=str,
+                        help="file listing further URLs, one per line, optionally preceded by their platform (e.g. \"panopto URL\")")
     parser.add_argument("-p", "--platform", metavar="platform",
                         type=str, default="ariel", choices=["ariel", "panopto"],
                         help="platform to download the video(s) from (default: ariel)")
@@ -75,11 +105,63 @@ def get_args(local: str) -> Namespace:
                         type=str, default=os.path.join(
                             local, "credentials.json"),
                         help="path of the credentials json to be used for logging into the platform")
+    parser.add_argument("--session-ttl", metavar="SECONDS", type=int, default=3600,
+                        help=f"reuse the login session, cached in {local}/sessions.json, for SECONDS seconds (0 to disable, default: 3600)")
+    parser.add_argument("--crawl", metavar="DEPTH", type=int,
+                        help="treat the Ariel URLs as course roots, collecting the videos of all the pages up to DEPTH links away from them")
+    parser.add_argument("--crawl-host", metavar="HOST", type=str, action="append", default=[],
+                        help="host the crawler may follow links to, besides the one of the course root (can be repeated)")
+    parser.add_argument("--no-page-cache", action="store_true",
+                        help="always download and parse the pages, even if they didn't change since the last run")
     parser.add_argument("-o", "--output", metavar="PATH",
                         type=str, default=os.getcwd(), help="directory to download the video(s) into")
+    parser.add_argument("--probe-duration", action="store_true",
+                        help="probe the duration of the files in the output directory with ffprobe, so that truncated ones are downloaded again")
     parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--metrics", metavar="PATH", type=str,
+                        help="append timing and throughput of each phase (login, page fetch, manifest extraction, download) as json lines to PATH")
+    parser.add_argument("--metrics-prometheus", metavar="PATH", type=str,
+                        help="write the totals of each phase to PATH in the Prometheus text format")
     parser.add_argument("-a", "--all", action="store_true",
                         help="download all videos not already present")
+    parser.add_argument("-j", "--jobs", metavar="N", type=int, default=1,
+                        help="number of videos to download in parallel (default: 1)")
+    parser.add_argument("--engine", metavar="engine", type=str, default="youtube-dl",
+                        choices=["youtube-dl", "native"],
+                        help="engine used for downloading: youtube-dl or the built-in parallel HLS downloader (default: youtube-dl)")
+    parser.add_argument("--segment-jobs", metavar="N", type=int, default=4,
+                        help="number of segments fetched in parallel for each video by the native engine (default: 4)")
+    parser.add_argument("--max-height", metavar="PIXELS", type=int,
+                        help="download the best variant of each video at most PIXELS high (e.g. 480)")
+    parser.add_argument("--max-bitrate", metavar="KBPS", type=int,
+                        help="download the best variant of each video of at most KBPS kbit/s")
+    parser.add_argument("--audio-only", action="store_true",
+                        help="download only the audio of each video, when the platform provides it separately")
+    parser.add_argument("--stream", action="store_true",
+                        help="remux the videos into mp4 with ffmpeg while downloading them, writing each of them once; interrupted downloads start over")
+    parser.add_argument("--remux", action="store_true",
+                        help="convert the downloaded videos to mp4 with ffmpeg, while the next ones are being downloaded")
+    parser.add_argument("--reencode", metavar="codec", type=str, choices=list(ENCODERS),
+                        help=f"also re-encode the video with a more compact codec ({', '.join(ENCODERS)}), implies --remux")
+    parser.add_argument("--thumbnail", action="store_true",
+                        help="extract a thumbnail of each downloaded video with ffmpeg")
+    parser.add_argument("--postprocess-jobs", metavar="N", type=int,
+                        help="number of videos post-processed in parallel (default: number of CPUs)")
+    parser.add_argument("--order", metavar="policy", type=str, default="none",
+                        choices=["none", "largest", "smallest"],
+                        help="estimate the size of the videos before downloading them, and download the largest (shortest overall time) or the smallest (first videos sooner) first (default: none, in the order they're found)")
+    parser.add_argument("--dedup", metavar="action", type=str, choices=["skip", "link"],
+                        help="before downloading, compare the videos with the ones already downloaded by duration and first and last segments, and skip the duplicates or hard-link them to the existing file")
+    parser.add_argument("--max-rate", metavar="RATE", type=parse_rate,
+                        help="maximum aggregate download rate in bytes/s, shared by all downloads (e.g. 500K, 2.5M)")
+    parser.add_argument("--retries", metavar="N", type=int, default=3,
+                        help="times a page, playlist or segment request failing because of the network or the server is retried (default: 3)")
+    parser.add_argument("--retry-backoff", metavar="SECONDS", type=float, default=1.0,
+                        help="delay before the first retry, doubled at each following one (default: 1)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adapt the number of segments fetched in parallel to the measured throughput and errors (native engine only)")
+    parser.add_argument("--watch", metavar="SECONDS", type=int,
+                        help="keep running, checking the pages every SECONDS seconds (with some jitter) and downloading all the new videos")
     parser.add_argument('--version', action='version',
                         version=f"%(prog)s {udlv}")
     modes = parser.add_argument_group("other modes")
@@ -87,12 +169,34 @@ def get_args(local: str) -> Namespace:
                        help=f"retrieve video names and manifests, but don't download anything nor update the downloaded list")
     modes.add_argument("--add-to-downloaded-only",
                        action="store_true", help="retrieve video names and manifests, but don't download anything, only update the downloaded list")
+    modes.add_argument("--job-spec", metavar="FILE", type=str,
+                       help="download, for each of the accounts listed in the json FILE, the videos of its URLs into its output directory, keeping a downloaded list per account")
+    modes.add_argument("--processes", metavar="N", type=int,
+                       help="number of --job-spec entries run in parallel, each by its own process (default: number of CPUs); --jobs bounds their downloads altogether")
     modes.add_argument("--cleanup-downloaded", action="store_true",
                        help="interactively select what videos to clean from the downloaded list")
     modes.add_argument("--wipe-credentials",
-                       action="store_true", help="delete stored credentials")
+                       action="store_true", help="delete stored credentials and cached sessions")
 
     opts = parser.parse_args()
+    if "url" in opts and not opts.url and not opts.batch and not opts.job_spec:
+        parser.error("at least one URL, a batch file or a job spec is required")
+    if opts.jobs < 1 or opts.segment_jobs < 1 or (opts.postprocess_jobs is not None and opts.postprocess_jobs < 1):
+        parser.error("the number of jobs must be at least 1")
+    if opts.retries < 0 or opts.retry_backoff < 0:
+        parser.error("the retries and their backoff can't be negative")
+    if opts.crawl is not None and opts.crawl < 0:
+        parser.error("the crawl depth can't be negative")
+    if opts.job_spec and (opts.watch is not None or opts.ask or opts.save):
+        parser.error("--job-spec can't be used with --watch, --ask or --save")
+    if opts.processes is not None and opts.processes < 1:
+        parser.error("the number of processes must be at least 1")
+    if opts.watch is not None:
+        if opts.watch < 1:
+            parser.error("the watch interval must be at least 1 second")
+        if opts.simulate or opts.add_to_downloaded_only or opts.order != "none" or opts.dedup:
+            parser.error(
+                "--watch can't be used with --simulate, --add-to-downloaded-only, --order or --dedup")
     return opts
 
 
@@ -156,66 +260,497 @@ def get_credentials(credentials_path: str, ask: bool, save: bool) -> tuple[str,
     return email, password
 
 
-def get_downloaded(downloaded_path: str) -> tuple[dict[str, dict[str, str]], TextIOWrapper]:
+def get_pages(urls: list[str], batch_path: str | None, default_platform: str) -> list[tuple[str, str]]:
+    """ Returns the (platform, URL) couples to process: {urls} belong to
+    {default_platform}, while each line of the file in {batch_path}
+    may specify its own platform before the URL """
+
     main_logger = logging.getLogger(__name__)
-    downloaded_dict = {}
-    if not os.path.isfile(downloaded_path):
-        downloaded_file = open(downloaded_path, "w")
-    else:
-        downloaded_file = open(downloaded_path, "r+")
-        if os.stat(downloaded_path).st_size:
+    pages = [(default_platform, url) for url in urls]
+    if batch_path:
+        try:
+            with open(batch_path, "r") as batch_file:
+                lines = batch_file.read().splitlines()
+        except OSError:
+            main_logger.error(f"Can't read batch file {batch_path}")
+            exit(1)
+        for line in lines:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if len(fields) == 1:
+                pages.append((default_platform, fields[0]))
+            elif len(fields) == 2 and fields[0] in ["ariel", "panopto"]:
+                pages.append((fields[0], fields[1]))
+            else:
+                main_logger.warning(f"Ignoring invalid batch line: {line}")
+    return [(platform, url.replace("\\", "")) for platform, url in pages]
+
+
+def iter_all_manifests(platforms: dict[str, Platform], pages: list[tuple[str, str]], jobs: int) -> Iterator[tuple[str, str]]:
+    """ Scans all {pages} concurrently, using the {platforms} logged in
+    for them, and yields the found (filename, manifest) couples as soon
+    as any page provides them, without duplicates.
+    A page failing is only logged, the others are still scanned """
+
+    main_logger = logging.getLogger(__name__)
+    found = Queue()
+
+    def scan(platform: str, url: str) -> None:
+        try:
+            for couple in platforms[platform].iter_manifests(url):
+                found.put(couple)
+        finally:
+            found.put(None)
+
+    titles = set()
+    known = set()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(scan, platform, url): url
+                   for platform, url in pages}
+        remaining = len(futures)
+        while remaining:
+            couple = found.get()
+            if couple is None:
+                remaining -= 1
+                continue
+            title, manifest = couple
+            if manifest in known:
+                continue
+            while title in titles:
+                title += "_other"
+            titles.add(title)
+            known.add(manifest)
+            yield title, manifest
+        for future, url in futures.items():
             try:
-                downloaded_dict = json_load(downloaded_file)
-            except JSONDecodeError:
-                main_logger.warning(
-                    f"Error parsing downloaded json. Consider deleting {downloaded_path}")
-    return downloaded_dict, downloaded_file
+                future.result()
+            except Exception as e:
+                main_logger.error(f"Failed getting {url}")
+                main_logger.debug(e)
+
+
+def download_video(manifest: str, output_path: str, hls_downloader: HLSDownloader | None = None, ratelimit: int | None = None, ydl_extra: dict | None = None) -> str | None:
+    """ Downloads the video pointed by {manifest} into {output_path}
+    (extension excluded), with {hls_downloader} if given or youtube-dl,
+    with the further options {ydl_extra} and downloading at most at
+    {ratelimit} bytes/s, otherwise.
+    Returns the path of the downloaded file, if known.
+    It can be run concurrently by the workers of {download}. """
+
+    with metrics.phase("download", video=os.path.basename(output_path),
+                       engine="native" if hls_downloader else "youtube-dl"):
+        if hls_downloader:
+            return hls_downloader.download(manifest, output_path)
+        else:
+            return ydl_download(manifest, output_path, ratelimit, ydl_extra)
+
+
+def ydl_download(manifest: str, output_path: str, ratelimit: int | None = None, ydl_extra: dict | None = None) -> str | None:
+    """ Downloads {manifest} with youtube-dl and returns the path of the
+    downloaded file. Every call builds its own YoutubeDL options, so
+    that it can be run concurrently """
+
+    import youtube_dl
+    from youtube_dl.utils import DownloadError
+
+    filenames = []
+
+    def progress_hook(progress: dict) -> None:
+        if _stopping.is_set():
+            raise DownloadError("Download stopped")
+        if progress["status"] == "finished":
+            metrics.add("bytes", progress.get("downloaded_bytes") or progress.get(
+                "total_bytes") or 0)
+            filenames.append(progress.get("filename"))
+
+    ydl_opts = {
+        "v": "true",
+        "nocheckcertificate": "true",
+        "restrictfilenames": "true",
+        # youtube-dl's own HLS downloader keeps track of the fragments
+        # already downloaded, so that interrupted downloads are resumed
+        "hls_prefer_native": True,
+        "continuedl": True,
+        "logger": logging.getLogger("youtube-dl"),
+        "progress_hooks": [progress_hook],
+        "outtmpl": output_path + ".%(ext)s"
+    }
+    if ratelimit:
+        ydl_opts["ratelimit"] = ratelimit
+    ydl_opts.update(ydl_extra or {})
+    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([manifest])
+    return filenames[-1] if filenames else None
+
+
+def report_variants(filename: str, manifest: str, hls_downloader: HLSDownloader, probe: tuple[list[Variant], Variant | None, MediaPlaylist] | None = None) -> None:
+    """ Prints the variants of {manifest} with their estimated size,
+    marking the one which would be downloaded. Its playlists are read
+    through {hls_downloader}, unless already given as {probe} """
+
+    variants, chosen, media = probe or hls_downloader.probe(manifest)
+    lines = [f"{filename}: {timedelta(seconds=round(media.duration))}"]
+    for variant in sorted(variants, key=lambda variant: variant.bandwidth, reverse=True):
+        resolution = f"{variant.height}p" if variant.height else "audio" if variant.audio_only else "?"
+        if variant.bandwidth:
+            bandwidth = f"{variant.bandwidth // 1000:>6} kbit/s  ~{format_size(variant.estimate_size(media.duration))}"
+        else:
+            # the audio renditions don't declare it
+            bandwidth = f"{'?':>6} kbit/s"
+        lines.append(
+            f"  {'*' if variant is chosen else ' '} {resolution:>6} {bandwidth}")
+    print("\n".join(lines))
+
+
+def plan(manifests: Iterable[tuple[str, str]], prober: HLSDownloader, ledger: Ledger, order: str = "none", estimate: bool = True, fingerprint: bool = False, probes: dict[str, tuple[list[Variant], Variant | None, MediaPlaylist]] | None = None) -> tuple[list[tuple[str, str]], dict[str, tuple[int | None, float]], dict[str, str]]:
+    """ Collects the (filename, manifest) couples in {manifests} and,
+    for the ones not in {ledger}, reads their playlists through {prober}
+    to estimate their {manifest: (bytes, seconds)}, from the sizes of a
+    few of their segments, if {estimate}, and to compute their
+    {manifest: fingerprint}, if {fingerprint}.
+    The results of the probes are kept in {probes}, if given, so that
+    the playlists aren't read again for reporting them.
+    The couples are sorted by {order}: "largest" or "smallest" first,
+    unknown sizes counting as none """
 
+    from .hls import HLSError
+
+    main_logger = logging.getLogger(__name__)
+    couples = list(manifests)
+    pending = list(dict.fromkeys(
+        manifest for _, manifest in couples if manifest not in ledger))
+    sizes = {}
+    fingerprints = {}
+
+    def inspect(manifest: str) -> None:
+        try:
+            probe = prober.probe(manifest)
+            if probes is not None:
+                probes[manifest] = probe
+            _, variant, media = probe
+            if estimate:
+                sizes[manifest] = (prober.estimate_size(
+                    variant, media), media.duration)
+            if fingerprint:
+                fingerprints[manifest] = prober.fingerprint(media)
+        except HLSError as e:
+            main_logger.warning(f"Can't inspect {manifest}")
+            main_logger.debug(e)
+            if estimate:
+                sizes.setdefault(manifest, (None, 0.0))
+
+    if pending and (estimate or fingerprint):
+        with metrics.phase("plan", videos=str(len(pending))), \
+                ThreadPoolExecutor(max_workers=min(len(pending), 16)) as executor:
+            for _ in executor.map(inspect, pending):
+                pass
+    if order != "none":
+        # sorted is stable: videos of the same size keep their order
+        couples.sort(key=lambda couple: sizes.get(couple[1], (None,))[0] or 0,
+                     reverse=order == "largest")
+    return couples, sizes, fingerprints
+
+
+def report_plan(sizes: dict[str, tuple[int | None, float]], prober: HLSDownloader, transfers: int, max_rate: int | None = None, probes: dict[str, tuple[list[Variant], Variant | None, MediaPlaylist]] | None = None) -> None:
+    """ Prints the total estimated size and duration of the videos in
+    {sizes}, and how long downloading them would take with {transfers}
+    connections at once, as fast as a sample segment was downloaded or
+    at {max_rate}. The media playlists already read are taken from
+    {probes} """
+
+    from .hls import HLSError
+
+    known = [size for size, _ in sizes.values() if size is not None]
+    total = sum(known)
+    duration = sum(seconds for _, seconds in sizes.values())
+    lines = [f"{len(sizes)} videos, {timedelta(seconds=round(duration))} long: ~{format_size(total)}"]
+    if len(known) != len(sizes):
+        lines[0] += f" ({len(sizes) - len(known)} of unknown size)"
+    rate = None
+    if sizes:
+        # the largest video has the most representative segments
+        manifest = max(sizes, key=lambda manifest: sizes[manifest][0] or 0)
+        try:
+            rate = prober.measure_rate(
+                manifest, probes[manifest][2] if probes and manifest in probes else None)
+        except HLSError as e:
+            logging.getLogger(__name__).debug(e)
+    if rate:
+        rate *= transfers
+        if max_rate:
+            rate = min(rate, max_rate)
+        lines.append(
+            f"ETA: {timedelta(seconds=round(total / rate))} at ~{format_size(rate)}/s")
+    elif max_rate:
+        lines.append(
+            f"ETA: {timedelta(seconds=round(total / max_rate))} at {format_size(max_rate)}/s")
+    print("\n".join(lines))
+
+
+def download(output_basepath: str, manifests: Iterable[tuple[str, str]], ledger: Ledger, simulate: bool, add_to_downloaded_only: bool, jobs: int = 1, hls_downloader: HLSDownloader | None = None, max_rate: int | None = None, output_index: OutputIndex | None = None, ydl_extra: dict | None = None, postprocessor: PostProcessor | None = None, budget: Semaphore | None = None, fingerprints: dict[str, str] | None = None, link_duplicates: bool = False, probes: dict[str, tuple[list[Variant], Variant | None, MediaPlaylist]] | None = None):
+    """ Downloads the (filename, manifest) couples in {manifests} which are
+    neither in {ledger} nor, according to {output_index}, already present
+    in {output_basepath}. {manifests} can be a lazy iterable: downloads
+    start as soon as its first couples are produced.
+    The videos whose {manifest: fingerprint} in {fingerprints} matches
+    one already downloaded, or being downloaded, aren't downloaded
+    again: they're only recorded in {ledger}, or hard-linked to the
+    existing file too if {link_duplicates}.
+    The native engine enforces {max_rate} through the limiter of
+    {hls_downloader}, while youtube-dl instances can only be given an
+    equal share of it each.
+    The downloaded files are handed to {postprocessor}, if given, which
+    works on them while the next ones are being downloaded.
+    Each download holds a slot of {budget}, if given, while it runs.
+    When simulating, {hls_downloader} is only used to report the
+    variants of each video, unless they were already read into {probes} """
+
+    from .hls import HLSError
 
-def download(output_basepath: str, manifest_dict: dict[str, str], downloaded_dict: dict, downloaded_file: TextIOWrapper, simulate: bool, add_to_downloaded_only: bool):
     main_logger = logging.getLogger(__name__)
     if not os.access(output_basepath, os.W_OK):
         main_logger.error(f"can't write to directory {output_basepath}")
         exit(1)
     else:
-        ydl_opts = {
-            "v": "true",
-            "nocheckcertificate": "true",
-            "restrictfilenames": "true",
-            "logger": logging.getLogger("youtube-dl")
-        }
-        for filename in manifest_dict:
-            manifest = manifest_dict[filename]
-            if manifest not in downloaded_dict:
-                output_path = os.path.join(output_basepath, filename)
-                ydl_opts["outtmpl"] = output_path + ".%(ext)s"
+        # an unwritable output fails a single video too
+        errors = (HLSError, OSError)
+        if not hls_downloader:
+            from youtube_dl.utils import DownloadError
+            errors += (DownloadError,)
+        # the workers only download: the ledger is updated by this
+        # thread as soon as each of them completes
+        futures = {}
+        processing = {}
+        fingerprints = fingerprints or {}
+        # {fingerprint: [(filename, manifest)]} of the duplicates of the
+        # videos being downloaded, handled once the file is final
+        duplicates = {}
+        if output_index:
+            output_index.refresh(output_basepath)
+
+        def deduplicate(filename: str, manifest: str, original: str, path: str | None) -> None:
+            fingerprint = fingerprints[manifest]
+            if link_duplicates and path and os.path.isfile(path):
+                link_path = os.path.join(
+                    output_basepath, filename + os.path.splitext(path)[1])
+                try:
+                    if not os.path.exists(link_path):
+                        os.link(path, link_path)
+                    main_logger.info(
+                        f"Not downloading {filename} since it's the same video as {original}, linked it")
+                    ledger.add(manifest, filename, fingerprint, link_path)
+                    if output_index:
+                        output_index.add(link_path)
+                    return
+                except OSError as e:
+                    main_logger.warning(
+                        f"Can't link {path} as {link_path}: {e}")
+            main_logger.info(
+                f"Not downloading {filename} since it's the same video as {original}")
+            ledger.add(manifest, filename, fingerprint, path)
+
+        def finished(filename: str, manifest: str, path: str | None) -> None:
+            fingerprint = fingerprints.get(manifest)
+            ledger.add(manifest, filename, fingerprint, path)
+            if output_index and path and os.path.isfile(path):
+                output_index.add(path)
+            for duplicate, duplicate_manifest in duplicates.pop(fingerprint, []):
+                deduplicate(duplicate, duplicate_manifest, filename, path)
+
+        def failed(manifest: str) -> None:
+            fingerprint = fingerprints.get(manifest)
+            waiting = duplicates.pop(fingerprint, None)
+            if waiting:
+                # the next copy of the same video is downloaded instead,
+                # the others still wait for it
+                (filename, manifest), *duplicates[fingerprint] = waiting
                 main_logger.info(f"Downloading {filename}")
-                if not simulate:
-                    if not add_to_downloaded_only:
-                        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                            ydl.download([manifest])
-                    downloaded_dict[manifest] = filename
-
-                    downloaded_file.seek(0)
-                    downloaded_file.write(json_dumps(downloaded_dict))
-                    downloaded_file.truncate()
+                submit(filename, manifest)
+
+        def complete(future: Future) -> None:
+            filename, manifest = futures.pop(future)
+            try:
+                path = future.result()
+            except errors as e:
+                main_logger.error(f"Failed downloading {filename}")
+                main_logger.debug(e)
+                failed(manifest)
+                return
+            if postprocessor and path:
+                # its fingerprint is recorded with the final file
+                ledger.add(manifest, filename)
+                processing[postprocessor.submit(path)] = (filename, manifest)
             else:
-                main_logger.info(
-                    f"Not downloading {filename} since it'd already been downloaded")
-        downloaded_file.close()
+                finished(filename, manifest, path)
+
+        def processed(future: Future) -> None:
+            filename, manifest = processing.pop(future)
+            try:
+                path = future.result()
+            except (PostProcessError, OSError) as e:
+                # the downloaded file is left as it is
+                main_logger.error(f"Failed post-processing {filename}")
+                main_logger.debug(e)
+                failed(manifest)
+                return
+            finished(filename, manifest, path)
+
+        def download_within_budget(*args) -> str | None:
+            with budget:
+                return download_video(*args)
+
+        def submit(filename: str, manifest: str) -> None:
+            futures[executor.submit(download_within_budget if budget else download_video, manifest, os.path.join(output_basepath, filename),
+                                    hls_downloader, max_rate and max_rate // jobs, ydl_extra)] = (filename, manifest)
+
+        def drain() -> None:
+            # a failure can start downloading one of its duplicates
+            while futures or processing:
+                done, _ = wait([*futures, *processing],
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in futures:
+                        complete(future)
+                    else:
+                        processed(future)
+
+        found = False
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        try:
+            for filename, manifest in manifests:
+                found = True
+                if manifest in ledger:
+                    main_logger.info(
+                        f"Not downloading {filename} since it'd already been downloaded")
+                    continue
+                present = output_index and output_index.find(
+                    output_basepath, filename)
+                if present:
+                    main_logger.info(
+                        f"Not downloading {filename} since {present} is already present")
+                    if not simulate:
+                        ledger.add(manifest, filename)
+                    continue
+                fingerprint = fingerprints.get(manifest)
+                if fingerprint:
+                    original = ledger.find(fingerprint)
+                    if original:
+                        if simulate:
+                            main_logger.info(
+                                f"Not downloading {filename} since it's the same video as {original[0]}")
+                        else:
+                            deduplicate(filename, manifest, *original)
+                        continue
+                    if fingerprint in duplicates:
+                        if simulate:
+                            main_logger.info(
+                                f"Not downloading {filename} since it's the same video as another one")
+                        else:
+                            main_logger.info(
+                                f"Not downloading {filename} since the same video is being downloaded")
+                            duplicates[fingerprint].append(
+                                (filename, manifest))
+                        continue
+                main_logger.info(f"Downloading {filename}")
+                if fingerprint:
+                    duplicates[fingerprint] = []
+                if simulate:
+                    if hls_downloader:
+                        try:
+                            report_variants(filename, manifest, hls_downloader,
+                                            probes.get(manifest) if probes else None)
+                        except HLSError as e:
+                            main_logger.warning(
+                                f"Can't get the variants of {filename}")
+                            main_logger.debug(e)
+                    continue
+                if add_to_downloaded_only:
+                    ledger.add(manifest, filename, fingerprint)
+                    continue
+                submit(filename, manifest)
+                for future in [future for future in futures if future.done()]:
+                    complete(future)
+                for future in [future for future in processing if future.done()]:
+                    processed(future)
+            drain()
+        except KeyboardInterrupt:
+            # the downloads in progress stop at their next chunk instead
+            # of being waited for, leaving their partial files behind
+            _stopping.set()
+            if hls_downloader:
+                hls_downloader.stop()
+            for future in [*futures, *processing]:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        except Exception:
+            # the downloads already started are still recorded when
+            # collecting the manifests fails
+            drain()
+            executor.shutdown()
+            raise
+        executor.shutdown()
+        if not found:
+            main_logger.warning("No videos found")
 
     main_logger.info("Downloaded completed")
 
 
-def cleanup_downloaded(downloaded_path: str) -> None:
+def update_cookies(session: Session, platforms: dict[str, Platform]) -> None:
+    """ Copies into {session} the cookies of every platform, for
+    manifests coming from any of them """
+
+    for platform in platforms.values():
+        session.cookies.update(platform.session.cookies)
+
+
+def watch(interval: int, platforms: dict[str, Platform], pages: list[tuple[str, str]], output_basepath: str, ledger: Ledger, download_queue: DownloadQueue, jobs: int = 1, hls_downloader: HLSDownloader | None = None, max_rate: int | None = None, output_index: OutputIndex | None = None, ydl_extra: dict | None = None, postprocessor: PostProcessor | None = None) -> None:
+    """ Scans {pages} every {interval} seconds, give or take a tenth, and
+    downloads the videos appeared since the previous scan, until
+    interrupted. The new videos go through {download_queue}, so that the
+    ones not downloaded yet are retried at the next scan, even by
+    another run """
+
     main_logger = logging.getLogger(__name__)
-    downloaded_dict, downloaded_file = get_downloaded(downloaded_path)
+    for platform in platforms.values():
+        # the session expires sooner or later: an empty page makes the
+        # platform log in again, but not more often than this
+        platform.relogin_interval = max(interval, WATCH_RELOGIN_INTERVAL)
+    seen = set()
+    while True:
+        with metrics.phase("poll", pages=len(pages)):
+            current = {manifest: filename for filename, manifest in iter_all_manifests(
+                platforms, pages, min(len(pages), 16))}
+        new = [(filename, manifest) for manifest, filename in current.items()
+               if manifest not in seen and manifest not in ledger]
+        seen = set(current)
+        queued = download_queue.push(new)
+        if queued:
+            main_logger.info(f"{queued} new videos found")
+        if len(download_queue):
+            if hls_downloader:
+                # a platform may have logged in again since the last time
+                update_cookies(hls_downloader.session, platforms)
+            download(output_basepath, download_queue.items(), ledger, False, False,
+                     jobs, hls_downloader, max_rate, output_index, ydl_extra, postprocessor)
+            download_queue.remove([manifest for _, manifest in download_queue.items()
+                                   if manifest in ledger])
+        # the jitter keeps several instances from polling in lockstep
+        delay = random.uniform(0.9 * interval, 1.1 * interval)
+        main_logger.info(f"Next check in {delay:.0f} seconds")
+        time.sleep(delay)
 
-    if len(downloaded_dict) == 0:
+
+def cleanup_downloaded(ledger: Ledger) -> None:
+    main_logger = logging.getLogger(__name__)
+
+    if len(ledger) == 0:
         main_logger.warning("The downloaded list is empty!")
         return
-    choices = list(downloaded_dict.keys())
-    entt = list(downloaded_dict.values())
+    downloaded = ledger.items()
+    choices = [manifest for manifest, _ in downloaded]
+    entt = [filename for _, filename in downloaded]
     main_logger.debug("Prompting user")
     try:
         chosen = multi_select(choices, entries_text=entt,
@@ -225,28 +760,278 @@ def cleanup_downloaded(downloaded_path: str) -> None:
         exit(1)
     main_logger.debug(f"{len(chosen)} names chosen")
     if len(chosen) != 0:
-        for manifest in chosen:
-            downloaded_dict.pop(manifest)
-        downloaded_file.seek(0)
-        downloaded_file.write(json_dumps(downloaded_dict))
-        downloaded_file.truncate()
-    downloaded_file.close()
+        ledger.remove(chosen)
     main_logger.info("Cleanup done")
 
 
-def wipe_credentials(credentials_path: str) -> None:
+def wipe_credentials(credentials_path: str, session_cache: SessionCache) -> None:
     main_logger = logging.getLogger(__name__)
-    if not os.path.isfile(credentials_path):
+    if not os.path.isfile(credentials_path) and not os.path.isfile(session_cache.path):
         main_logger.warning("Credentials file not found")
         return
     main_logger.debug("Prompting user")
     choice = input(
-        "Are you sure you want to delete stored credentials? [y/N]: ").lower()
+        "Are you sure you want to delete stored credentials and cached sessions? [y/N]: ").lower()
     if choice == "y" or choice == "yes":
-        os.remove(credentials_path)
-        main_logger.info("Credentials file deleted")
+        if os.path.isfile(credentials_path):
+            os.remove(credentials_path)
+        # the cached sessions are as good as the credentials
+        session_cache.wipe()
+        main_logger.info("Credentials and cached sessions deleted")
     else:
-        main_logger.info("Credentials file kept")
+        main_logger.info("Credentials and cached sessions kept")
+
+
+def get_job_specs(path: str) -> list[dict]:
+    """ Returns the entries of the job spec in {path}: a json list of
+    objects with the "urls" to download from, their "platform" (ariel by
+    default), the "output" directory, and the account, either as "email"
+    and "password" or as the path of a "credentials" file like -c's """
+
+    main_logger = logging.getLogger(__name__)
+    try:
+        with open(path, "r") as spec_file:
+            specs = json_load(spec_file)
+    except (OSError, JSONDecodeError) as e:
+        main_logger.error(f"Can't read job spec {path}: {e}")
+        exit(1)
+    if not isinstance(specs, list):
+        main_logger.error(f"The job spec {path} must be a list")
+        exit(1)
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not spec.get("urls") or not spec.get("output") \
+                or spec.get("platform", "ariel") not in ["ariel", "panopto"]:
+            main_logger.error(f"Invalid entry {i} of job spec {path}")
+            exit(1)
+        if "credentials" in spec:
+            # never asked for: nobody may be there to answer
+            try:
+                with open(spec["credentials"], "r") as credentials_file:
+                    creds = json_load(credentials_file)
+                spec.update(email=creds["email"], password=creds["password"])
+            except (OSError, JSONDecodeError, TypeError, KeyError) as e:
+                main_logger.error(
+                    f"Invalid credentials {spec['credentials']} for entry {i} of job spec {path}: {e}")
+                exit(1)
+        elif "email" not in spec or "password" not in spec:
+            main_logger.error(
+                f"No credentials for entry {i} of job spec {path}")
+            exit(1)
+    return specs
+
+
+# the budget of concurrent downloads shared by the job spec workers
+_job_budget = None
+
+
+class JobError(Exception):
+    """ Failure of a job spec entry, carrying the metrics totals recorded
+    by the worker process while running it """
+
+    def __init__(self, message: str, totals: dict) -> None:
+        super().__init__(message, totals)
+        self.totals = totals
+
+    def __str__(self) -> str:
+        return self.args[0]
+
+
+def init_job_worker(verbose: bool, local_path: str, retries: int, retry_backoff: float, budget: Semaphore, metrics_path: str | None) -> None:
+    global _job_budget
+    # forked workers inherit the logging set up by the main process
+    if not logging.getLogger().handlers:
+        log_setup(verbose, local_path)
+    # and its metrics file: spawned ones append to it themselves, while
+    # the Prometheus totals are still written by the main process
+    if metrics_path and not metrics.file:
+        metrics.setup(metrics_path)
+    retrier.setup(retries, retry_backoff)
+    _job_budget = budget
+    # and the totals of its metrics, which it reports itself
+    metrics.pop_totals()
+
+
+def run_job(opts: Namespace, local_path: str, spec: dict) -> dict:
+    """ Runs the job spec entry {spec} in a worker process, with the
+    ledger of its account, and returns the metrics totals recorded
+    meanwhile: the workers don't write them, the main process does """
+
+    account = hashlib.sha256(spec["email"].encode()).hexdigest()[:16]
+    account_path = os.path.join(local_path, "accounts", account)
+    os.makedirs(account_path, exist_ok=True)
+    os.makedirs(spec["output"], exist_ok=True)
+    pages = [(spec.get("platform", "ariel"), url.replace("\\", ""))
+             for url in spec["urls"]]
+    try:
+        run(opts, local_path, spec["email"], spec["password"], pages, spec["output"],
+            os.path.join(account_path, "downloaded.db"), interactive=False, budget=_job_budget)
+    except (Exception, SystemExit) as e:
+        raise JobError(str(e) or type(e).__name__,
+                       metrics.pop_totals()) from None
+    return metrics.pop_totals()
+
+
+def run_jobs(opts: Namespace, local_path: str, specs: list[dict]) -> None:
+    """ Runs the job spec entries {specs} in parallel, each in its own
+    process, while at most {opts.jobs} videos are downloaded at once
+    overall """
+
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    main_logger = logging.getLogger(__name__)
+    processes = min(len(specs), opts.processes or os.cpu_count())
+    if opts.max_rate:
+        # every worker has its own limiter
+        opts.max_rate = max(1, opts.max_rate // processes)
+    budget = multiprocessing.BoundedSemaphore(opts.jobs)
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_job_worker,
+                             initargs=(opts.verbose, local_path, opts.retries, opts.retry_backoff, budget, opts.metrics)) as executor:
+        futures = {executor.submit(run_job, opts, local_path, spec): i
+                   for i, spec in enumerate(specs)}
+        for future in as_completed(futures):
+            try:
+                metrics.merge(future.result())
+            except JobError as e:
+                metrics.merge(e.totals)
+                main_logger.error(f"Job {futures[future]} failed")
+                main_logger.debug(e)
+            except Exception as e:
+                main_logger.error(f"Job {futures[future]} failed")
+                main_logger.debug(e)
+            else:
+                main_logger.info(f"Job {futures[future]} completed")
+
+
+def run(opts: Namespace, local_path: str, email: str, password: str, pages: list[tuple[str, str]], output_path: str, ledger_path: str, legacy_ledger_path: str | None = None, interactive: bool = True, budget: Semaphore | None = None) -> None:
+    """ Logs into the platforms of {pages} with {email} and {password}
+    and downloads their videos into {output_path}, as {opts} say,
+    recording them in the ledger at {ledger_path}. Unless {interactive},
+    all the videos are downloaded without asking which ones """
+
+    from requests import Session
+
+    from .hls import HLSDownloader, VariantSelector, mount_pool
+    from .platform import PageCache, SessionCache, getPlatform
+    from .platform.panopto import FOLDER_RE
+
+    main_logger = logging.getLogger(__name__)
+    sessions_path = os.path.join(local_path, "sessions.json")
+    page_cache = None if opts.no_page_cache else PageCache(
+        os.path.join(local_path, "pages.db"))
+    session_cache = SessionCache(sessions_path, opts.session_ttl)
+    # a single login for each platform, shared by all its pages
+    platforms = {platform: getPlatform(email, password, platform, session_cache if opts.session_ttl > 0 else None, page_cache)
+                 for platform in sorted(set(platform for platform, _ in pages))}
+    if opts.crawl is not None:
+        if "ariel" in platforms:
+            platforms["ariel"].crawl_depth = opts.crawl
+            platforms["ariel"].crawl_hosts = opts.crawl_host
+        if "panopto" in platforms:
+            main_logger.warning(
+                "Only Ariel courses can be crawled, Panopto URLs are downloaded as they are")
+    manifests = iter_all_manifests(platforms, pages, min(len(pages), 16))
+    selected = True
+    # every Panopto URL but the folders' corresponds to a single video:
+    # in that case, as with -a, downloads start while the pages are
+    # still being scanned
+    single_videos = all(platform == "panopto" and not FOLDER_RE.search(url)
+                        for platform, url in pages)
+    if interactive and not (opts.all or opts.watch or single_videos):
+        all_manifest_dict = dict(manifests)
+        manifests = all_manifest_dict.items()
+        if len(all_manifest_dict) != 0:
+            try:
+                selection = multi_select(
+                    list(all_manifest_dict.keys()), selection_text="\nVideos to download: ")
+            except WrongSelectionError:
+                main_logger.error("Your selection is not valid")
+                exit(1)
+            manifests = [(name, all_manifest_dict[name])
+                         for name in selection]
+            selected = len(selection) != 0
+            main_logger.info(f"Videos: {selection}")
+
+    if selected:
+        selector = VariantSelector(
+            opts.max_height, opts.max_bitrate, opts.audio_only)
+        stream = opts.stream and not opts.simulate
+        if stream and not PostProcessor.available():
+            main_logger.warning(
+                "ffmpeg not found, the videos won't be remuxed while downloading")
+            stream = False
+        hls_downloader = None
+        prober = None
+        # when simulating, the native engine only reads the playlists,
+        # whichever engine is chosen, and it estimates the sizes of the
+        # videos and fingerprints them for the youtube-dl one too
+        estimate = opts.simulate or opts.order != "none"
+        if opts.engine == "native" or estimate or opts.dedup:
+            download_session = Session()
+            update_cookies(download_session, platforms)
+            # the planning pass estimates up to 16 videos at once
+            mount_pool(download_session, max(
+                opts.jobs * opts.segment_jobs, 16))
+            prober = HLSDownloader(
+                download_session, opts.segment_jobs,
+                TokenBucket(opts.max_rate) if opts.max_rate else None,
+                ConcurrencyController(opts.jobs * opts.segment_jobs) if opts.adaptive else None,
+                selector, stream)
+            if opts.engine == "native" or opts.simulate:
+                hls_downloader = prober
+        if opts.adaptive and opts.engine != "native":
+            main_logger.warning(
+                "Adaptive concurrency is only available with the native engine")
+        ydl_extra = {"format": selector.format(),
+                     "retries": opts.retries,
+                     "fragment_retries": opts.retries,
+                     "socket_timeout": REQUEST_TIMEOUT[1]}
+        if stream:
+            # ffmpeg itself downloads and remuxes the stream
+            ydl_extra["hls_prefer_native"] = False
+
+        postprocessor = None
+        # streamed videos are already remuxed
+        remux = opts.remux and not stream
+        if (remux or opts.reencode or opts.thumbnail) and not opts.simulate:
+            if PostProcessor.available():
+                postprocessor = PostProcessor(
+                    remux, opts.reencode, opts.thumbnail, opts.postprocess_jobs)
+                if postprocessor.remux:
+                    # remuxing is left to the post-processing stage
+                    ydl_extra["fixup"] = "never"
+            else:
+                main_logger.warning(
+                    "ffmpeg not found, the videos won't be post-processed")
+
+        with Ledger(ledger_path, legacy_ledger_path) as ledger, \
+                OutputIndex(os.path.join(local_path, "outputs.db"), opts.probe_duration) as output_index, \
+                postprocessor or nullcontext():
+            if opts.watch:
+                main_logger.debug("MODE: WATCH")
+                with DownloadQueue(os.path.join(local_path, "queue.db")) as download_queue:
+                    try:
+                        watch(opts.watch, platforms, pages, output_path, ledger, download_queue, opts.jobs,
+                              hls_downloader, opts.max_rate, output_index, ydl_extra, postprocessor)
+                    except KeyboardInterrupt:
+                        main_logger.info("Stopped watching")
+            else:
+                fingerprints = None
+                # when simulating, the playlists read for planning are
+                # reported without reading them again
+                probes = {} if opts.simulate else None
+                if estimate or opts.dedup:
+                    # the sizes and fingerprints are needed before the
+                    # first download starts, so all the pages are
+                    # scanned first
+                    manifests, sizes, fingerprints = plan(
+                        manifests, prober, ledger, opts.order, estimate, opts.dedup is not None, probes)
+                    if opts.simulate:
+                        report_plan(sizes, prober, opts.jobs * (opts.segment_jobs if opts.engine == "native" else 1),
+                                    opts.max_rate, probes)
+                download(output_path, manifests, ledger, opts.simulate, opts.add_to_downloaded_only, opts.jobs,
+                         hls_downloader, opts.max_rate, output_index, ydl_extra, postprocessor, budget,
+                         fingerprints, opts.dedup == "link", probes)
 
 
 def main():
@@ -255,8 +1040,13 @@ def main():
         os.makedirs(local_path)
 
     opts = get_args(local_path)
-    downloaded_path = os.path.join(local_path, "downloaded.json")
+    downloaded_path = os.path.join(local_path, "downloaded.db")
+    legacy_downloaded_path = os.path.join(local_path, "downloaded.json")
+    sessions_path = os.path.join(local_path, "sessions.json")
     log_setup(opts.verbose, local_path)
+    metrics.setup(opts.metrics, opts.metrics_prometheus)
+    retrier.setup(opts.retries, opts.retry_backoff)
+    atexit.register(metrics.close)
     main_logger = logging.getLogger(__name__)
 
     main_logger.debug(
@@ -268,61 +1058,64 @@ def main():
     Version: {pt.version()}
     Local: {local_path}
     Python: {sys.version}
-    Requests: {reqv}
-    YoutubeDL: {ytdv}
     Downloaded file: {downloaded_path}""")
 
     if opts.cleanup_downloaded:
         main_logger.debug("MODE: DOWNLOADED CLEANUP")
-        cleanup_downloaded(downloaded_path)
+        with Ledger(downloaded_path, legacy_downloaded_path) as ledger:
+            cleanup_downloaded(ledger)
         main_logger.debug(
             f"=============job end at {datetime.now()}=============\n")
         exit(0)
     elif opts.wipe_credentials:
         main_logger.debug("MODE: WIPE CREDENTIALS")
-        wipe_credentials(opts.credentials)
+        from .platform.session_cache import SessionCache
+        wipe_credentials(opts.credentials, SessionCache(sessions_path))
         main_logger.debug(
             f"=============job end at {datetime.now()}=============\n")
         exit(0)
 
-    opts.url = opts.url.replace("\\", "")
+    from requests import __version__ as reqv
+
+    main_logger.debug(f"Requests: {reqv}")
+    if opts.engine == "youtube-dl":
+        from youtube_dl.version import __version__ as ytdv
+        main_logger.debug(f"YoutubeDL: {ytdv}")
+
+    pages = get_pages(opts.url, opts.batch, opts.platform)
     main_logger.debug(f"""MODE: {"SIMULATE" if opts.simulate else "ADD TO DOWNLOADED ONLY" if opts.add_to_downloaded_only else "DOWNLOAD"}
     Request info:
-    URL: {opts.url}
+    URLs: {pages}
+    Batch: {opts.batch}
     Platform: {opts.platform}
     Save: {opts.save}
     Ask: {opts.ask}
     All: {opts.all}
+    Jobs: {opts.jobs}
+    Engine: {opts.engine}
+    Max rate: {opts.max_rate}
+    Retries: {opts.retries}
+    Adaptive: {opts.adaptive}
+    Max height: {opts.max_height}
+    Max bitrate: {opts.max_bitrate}
+    Audio only: {opts.audio_only}
+    Stream: {opts.stream}
+    Remux: {opts.remux}
+    Reencode: {opts.reencode}
+    Thumbnail: {opts.thumbnail}
+    Watch: {opts.watch}
+    Crawl: {opts.crawl} {opts.crawl_host}
     Credentials: {opts.credentials}
-    Output: {opts.output}""")
-
-    email, password = get_credentials(opts.credentials, opts.ask, opts.save)
+    Output: {opts.output}
+    Probe duration: {opts.probe_duration}""")
 
-    all_manifest_dict = getPlatform(
-        email, password, opts.platform).get_manifests(opts.url)
-
-    if len(all_manifest_dict) == 0:
-        main_logger.warning("No videos found")
+    if opts.job_spec:
+        main_logger.debug("MODE: JOB SPEC")
+        run_jobs(opts, local_path, get_job_specs(opts.job_spec))
     else:
-        if opts.all or opts.platform == "panopto":
-            manifest_dict = all_manifest_dict
-        else:
-            try:
-                selection = multi_select(
-                    list(all_manifest_dict.keys()), selection_text="\nVideos to download: ")
-            except WrongSelectionError:
-                main_logger.error("Your selection is not valid")
-                exit(1)
-            manifest_dict = {
-                name: all_manifest_dict[name] for name in selection}
-
-        if len(manifest_dict) != 0:
-            main_logger.info(f"Videos: {list(manifest_dict.keys())}")
-
-            downloaded_dict, downloaded_file = get_downloaded(downloaded_path)
-
-            download(opts.output, manifest_dict, downloaded_dict,
-                     downloaded_file, opts.simulate, opts.add_to_downloaded_only)
-            downloaded_file.close()
+        email, password = get_credentials(
+            opts.credentials, opts.ask, opts.save)
+        run(opts, local_path, email, password, pages, opts.output,
+            downloaded_path, legacy_downloaded_path)
     main_logger.debug(
         f"=============job end at {datetime.now()}=============\n")
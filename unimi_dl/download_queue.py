@@ -0,0 +1,76 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+import sqlite3
+import threading
+import time
+
+
+class DownloadQueue:
+    """ Persistent queue of the videos found by the watch mode and not
+    downloaded yet: a video leaves it only once it's been downloaded, so
+    that neither failures nor restarts lose it """
+
+    def __init__(self, path: str) -> None:
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS queue (
+                manifest TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                queued REAL NOT NULL)""")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def items(self) -> list[tuple[str, str]]:
+        """ Returns the queued (filename, manifest) couples, oldest first """
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT filename, manifest FROM queue ORDER BY queued, rowid").fetchall()
+
+    def push(self, couples: list[tuple[str, str]]) -> int:
+        """ Queues the (filename, manifest) {couples} which aren't queued
+        yet, and returns how many of them were """
+
+        now = time.time()
+        with self.lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany("INSERT OR IGNORE INTO queue VALUES (?, ?, ?)",
+                                        [(manifest, filename, now) for filename, manifest in couples])
+            return self.connection.total_changes - before
+
+    def remove(self, manifests: list[str]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM queue WHERE manifest = ?", [(manifest,) for manifest in manifests])
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self) -> DownloadQueue:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -0,0 +1,651 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from json import dumps as json_dumps, loads as json_loads
+from json.decoder import JSONDecodeError
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Iterator
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import disable_warnings
+from urllib3.exceptions import InsecureRequestWarning
+
+from .metrics import metrics
+from .retry import REQUEST_TIMEOUT, retrier
+from .throttle import ConcurrencyController, TokenBucket
+
+
+class HLSError(Exception):
+    pass
+
+
+_video_codecs = ("avc1", "avc3", "hvc1", "hev1", "vp08", "vp09", "av01")
+_packed_audio = ("aac", "ac3", "ec3", "mp3")
+
+
+class Variant:
+    """ A stream listed in a master playlist, or one of its alternative
+    audio renditions (#EXT-X-MEDIA) if {rendition}.
+    {audio_group} is the group of renditions the audio of a stream comes
+    from, or the group a rendition belongs to. """
+
+    def __init__(self, uri: str, bandwidth: int = 0, width: int = 0, height: int = 0, codecs: str = "",
+                 audio_group: str = "", rendition: bool = False, default: bool = False) -> None:
+        self.uri = uri
+        self.bandwidth = bandwidth
+        self.width = width
+        self.height = height
+        self.codecs = codecs
+        self.audio_group = audio_group
+        self.rendition = rendition
+        self.default = default
+
+    @property
+    def audio_only(self) -> bool:
+        if self.rendition:
+            return True
+        codecs = [codec.strip() for codec in self.codecs.split(",") if codec.strip()]
+        return bool(codecs) and not self.height and not any(
+            codec.startswith(_video_codecs) for codec in codecs)
+
+    def estimate_size(self, duration: float) -> int:
+        """ Returns the bytes of {duration} seconds of this variant,
+        estimated from its declared bandwidth """
+
+        return int(self.bandwidth / 8 * duration)
+
+
+class VariantSelector:
+    """ Chooses the variant to download among the ones of a master
+    playlist: the one with the highest bandwidth within {max_height}
+    (pixels) and {max_bitrate} (kbit/s), or among the audio-only ones,
+    audio renditions included, if {audio_only}. When no variant fits,
+    the smallest stream is chosen. """
+
+    def __init__(self, max_height: int | None = None, max_bitrate: int | None = None, audio_only: bool = False) -> None:
+        self.max_height = max_height
+        self.max_bitrate = max_bitrate
+        self.audio_only = audio_only
+
+    def fits(self, variant: Variant) -> bool:
+        if self.audio_only and not variant.audio_only:
+            return False
+        if self.max_height and variant.height > self.max_height:
+            return False
+        if self.max_bitrate and variant.bandwidth > self.max_bitrate * 1000:
+            return False
+        return True
+
+    def select(self, variants: list[Variant]) -> Variant:
+        # the audio renditions go with a stream, they aren't one, unless
+        # only the audio is wanted
+        streams = [variant for variant in variants if not variant.rendition]
+        fitting = [variant for variant in (variants if self.audio_only else streams)
+                   if self.fits(variant)]
+        if fitting:
+            # renditions don't declare their bandwidth: the default one
+            # is the best guess
+            return max(fitting, key=lambda variant: (variant.bandwidth, variant.default))
+        return min(streams, key=lambda variant: variant.bandwidth)
+
+    def format(self) -> str:
+        """ Returns the equivalent youtube-dl format selector """
+
+        if self.audio_only:
+            return "bestaudio/worst"
+        filters = ""
+        if self.max_height:
+            filters += f"[height<=?{self.max_height}]"
+        if self.max_bitrate:
+            filters += f"[tbr<=?{self.max_bitrate}]"
+        return f"best{filters}/worst" if filters else "best"
+
+
+class Segment:
+    """ A media segment listed in a media playlist: the whole resource at
+    {uri}, or only its (offset, length) {byterange} """
+
+    def __init__(self, uri: str, duration: float, byterange: tuple[int, int] | None = None) -> None:
+        self.uri = uri
+        self.duration = duration
+        self.byterange = byterange
+
+
+class MediaPlaylist:
+    def __init__(self, segments: list[Segment], init_uri: str | None = None, init_byterange: tuple[int, int] | None = None) -> None:
+        self.segments = segments
+        self.init_uri = init_uri
+        self.init_byterange = init_byterange
+
+    @property
+    def init(self) -> Segment | None:
+        """ The initialization section, as a segment lasting nothing """
+
+        return Segment(self.init_uri, 0.0, self.init_byterange) if self.init_uri else None
+
+    @property
+    def all_segments(self) -> list[Segment]:
+        """ The segments, preceded by the initialization section if any """
+
+        return [self.init, *self.segments] if self.init_uri else self.segments
+
+    @property
+    def duration(self) -> float:
+        return sum(segment.duration for segment in self.segments)
+
+    @property
+    def extension(self) -> str:
+        # fragmented mp4 streams come with an initialization section
+        if self.init_uri:
+            return "mp4"
+        # audio renditions may be packed audio rather than MPEG-TS
+        extension = os.path.splitext(urllib.parse.urlparse(
+            self.segments[0].uri).path)[1][1:].lower() if self.segments else ""
+        return extension if extension in _packed_audio else "ts"
+
+
+_attribute_re = re.compile(r"([A-Z0-9-]+)=(\"[^\"]*\"|[^,]*)")
+
+
+def parse_attributes(line: str) -> dict[str, str]:
+    """ Returns the attributes of the tag {line}, unquoted """
+
+    _, _, attributes = line.partition(":")
+    return {key: value.strip("\"") for key, value in _attribute_re.findall(attributes)}
+
+
+def parse_byterange(value: str, next_offset: int = 0) -> tuple[int, int]:
+    """ Returns the (offset, length) of the byte range {value}
+    ("<length>[@<offset>]"), starting at {next_offset} if unspecified """
+
+    length, _, offset = value.partition("@")
+    return (int(offset) if offset else next_offset, int(length))
+
+
+def is_master(playlist: str) -> bool:
+    return "#EXT-X-STREAM-INF" in playlist
+
+
+def parse_master(playlist: str, base_url: str) -> list[Variant]:
+    """ Returns the variants listed in the master {playlist}, followed by
+    its audio renditions, with their URIs resolved against {base_url}.
+    Renditions without URI are in the streams already, and are left out """
+
+    variants = []
+    renditions = []
+    attributes = None
+    for line in playlist.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            attributes = parse_attributes(line)
+        elif line.startswith("#EXT-X-MEDIA:"):
+            media = parse_attributes(line)
+            if media.get("TYPE") == "AUDIO" and media.get("URI"):
+                renditions.append(Variant(urllib.parse.urljoin(base_url, media["URI"]),
+                                          audio_group=media.get("GROUP-ID", ""), rendition=True,
+                                          default=media.get("DEFAULT") == "YES"))
+        elif line and not line.startswith("#") and attributes is not None:
+            width, _, height = attributes.get("RESOLUTION", "0x0").partition("x")
+            variants.append(Variant(urllib.parse.urljoin(base_url, line),
+                                    int(attributes.get("BANDWIDTH", 0)),
+                                    int(width or 0), int(height or 0),
+                                    attributes.get("CODECS", ""),
+                                    attributes.get("AUDIO", "")))
+            attributes = None
+    return variants + renditions
+
+
+def parse_media(playlist: str, base_url: str) -> MediaPlaylist:
+    """ Returns the segments listed in the media {playlist},
+    with their URIs resolved against {base_url} """
+
+    segments = []
+    init_uri = None
+    init_byterange = None
+    duration = 0.0
+    byterange = None
+    # where a byte range without offset starts: right after the last one
+    next_offset = 0
+    for line in playlist.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF"):
+            duration = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            byterange = parse_byterange(
+                line[len("#EXT-X-BYTERANGE:"):], next_offset)
+        elif line.startswith("#EXT-X-KEY"):
+            if parse_attributes(line).get("METHOD", "NONE") != "NONE":
+                raise HLSError("Encrypted streams are not supported")
+        elif line.startswith("#EXT-X-MAP"):
+            attributes = parse_attributes(line)
+            init_uri = urllib.parse.urljoin(base_url, attributes["URI"])
+            if "BYTERANGE" in attributes:
+                init_byterange = parse_byterange(attributes["BYTERANGE"])
+        elif line and not line.startswith("#"):
+            segments.append(
+                Segment(urllib.parse.urljoin(base_url, line), duration, byterange))
+            next_offset = sum(byterange) if byterange else 0
+            duration = 0.0
+            byterange = None
+    return MediaPlaylist(segments, init_uri, init_byterange)
+
+
+class Checkpoint:
+    """ Sidecar of a partial download, recording size and digest of each
+    segment already written to it. Segments are always written in order,
+    so the checkpoint is an append-only list describing a prefix of the
+    partial file: a torn last line only loses the last segment. """
+
+    def __init__(self, path: str, key: str) -> None:
+        self.path = path
+        self.key = key
+        self.file = None
+
+    def load(self) -> list[tuple[int, str]]:
+        """ Returns size and digest of the segments recorded in the
+        checkpoint, or an empty list if it refers to another stream """
+
+        if not os.path.isfile(self.path):
+            return []
+        with open(self.path, "r") as checkpoint_file:
+            lines = checkpoint_file.read().splitlines()
+        try:
+            if not lines or json_loads(lines[0]).get("key") != self.key:
+                return []
+        except (JSONDecodeError, AttributeError):
+            return []
+        segments = []
+        for line in lines[1:]:
+            size, _, digest = line.partition(" ")
+            if not size.isdigit() or len(digest) != 40:
+                break
+            segments.append((int(size), digest))
+        return segments
+
+    def open(self, segments: list[tuple[int, str]]) -> None:
+        """ Rewrites the checkpoint so that it contains only {segments},
+        then keeps it open for appending """
+
+        with open(self.path, "w") as checkpoint_file:
+            checkpoint_file.write(json_dumps({"key": self.key}) + "\n")
+            for size, digest in segments:
+                checkpoint_file.write(f"{size} {digest}\n")
+        self.file = open(self.path, "a")
+
+    def append(self, size: int, digest: str) -> None:
+        self.file.write(f"{size} {digest}\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def remove(self) -> None:
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def verify_part(part_path: str, segments: list[tuple[int, str]]) -> list[tuple[int, str]]:
+    """ Returns the longest prefix of {segments} actually found, intact,
+    at the beginning of {part_path} """
+
+    verified = []
+    if not os.path.isfile(part_path):
+        return verified
+    with open(part_path, "rb") as part:
+        for size, digest in segments:
+            data = part.read(size)
+            if len(data) != size or hashlib.sha1(data).hexdigest() != digest:
+                break
+            verified.append((size, digest))
+    return verified
+
+
+def mount_pool(session: requests.Session, size: int) -> None:
+    """ Lets {session} keep up to {size} connections open per host,
+    so that parallel segment requests don't have to reconnect """
+
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+class HLSDownloader:
+    """ Downloads HLS streams by fetching their segments in parallel
+    over an (authenticated) session and writing them in order. """
+
+    def __init__(self, session: requests.Session, workers: int = 4, limiter: TokenBucket | None = None, controller: ConcurrencyController | None = None, selector: VariantSelector | None = None, stream: bool = False) -> None:
+        """ {limiter} and {controller}, if given, are shared by all the
+        downloads to bound their aggregate rate and concurrency.
+        With {stream}, the segments are remuxed into mp4 by ffmpeg
+        while they are downloaded, instead of being stored as they are """
+
+        self.logger = logging.getLogger(__name__)
+        self.session = session
+        self.workers = workers
+        self.limiter = limiter
+        self.controller = controller
+        self.selector = selector or VariantSelector()
+        self.stream = stream
+        self.stopping = threading.Event()
+        # same policy as the youtube-dl engine ("nocheckcertificate")
+        disable_warnings(InsecureRequestWarning)
+
+    def stop(self) -> None:
+        """ Makes the downloads in progress fail at their next chunk,
+        leaving their partial files to be resumed """
+
+        self.stopping.set()
+
+    def fetch(self, url: str, byterange: tuple[int, int] | None = None) -> bytes:
+        """ Returns the body of {url}, or only its (offset, length)
+        {byterange}, retrying the request on transient failures: an
+        interrupted transfer is started again from scratch """
+
+        try:
+            return retrier.call(url, lambda: self.fetch_once(url, byterange))
+        except requests.RequestException as e:
+            raise HLSError(f"Error fetching {url}: {e}") from e
+
+    def fetch_once(self, url: str, byterange: tuple[int, int] | None = None) -> bytes:
+        if self.stopping.is_set():
+            raise HLSError("Download stopped")
+        if self.controller:
+            self.controller.acquire()
+        chunks = []
+        error = False
+        headers = {}
+        if byterange:
+            offset, length = byterange
+            headers["Range"] = f"bytes={offset}-{offset + length - 1}"
+        try:
+            response = self.session.get(
+                url, verify=False, stream=True, headers=headers, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            if byterange and response.status_code != 206:
+                raise HLSError(f"The server of {url} ignored the byte range")
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if self.stopping.is_set():
+                    raise HLSError("Download stopped")
+                if self.limiter:
+                    self.limiter.consume(len(chunk))
+                chunks.append(chunk)
+        except requests.RequestException:
+            error = True
+            raise
+        finally:
+            if self.controller:
+                self.controller.release(
+                    sum(len(chunk) for chunk in chunks), error)
+        return b"".join(chunks)
+
+    def probe(self, manifest: str) -> tuple[list[Variant], Variant | None, MediaPlaylist]:
+        """ Returns the variants listed by {manifest}, the one chosen by
+        the selector and its media playlist. If {manifest} is already a
+        media playlist, there are no variants to choose from """
+
+        playlist = self.fetch(manifest).decode()
+        if not is_master(playlist):
+            return [], None, parse_media(playlist, manifest)
+        variants = parse_master(playlist, manifest)
+        if not variants:
+            raise HLSError(f"No variants found in {manifest}")
+        variant = self.selector.select(variants)
+        self.logger.debug(f"Chosen variant: {variant.uri}")
+        return variants, variant, parse_media(self.fetch(variant.uri).decode(), variant.uri)
+
+    def head_size(self, url: str) -> int | None:
+        """ Returns the size of {url} declared by the server, if any """
+
+        def attempt() -> requests.Response:
+            response = self.session.head(
+                url, verify=False, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return response
+
+        try:
+            length = retrier.call(url, attempt).headers.get("Content-Length")
+        except requests.RequestException as e:
+            raise HLSError(f"Error fetching {url}: {e}") from e
+        return int(length) if length and length.isdigit() else None
+
+    def estimate_size(self, variant: Variant | None, media: MediaPlaylist, samples: int = 3) -> int | None:
+        """ Returns the estimated bytes of {media}, the media playlist of
+        {variant} returned by {probe}, without downloading it: the sizes
+        of {samples} segments spread across it are extrapolated to its
+        duration, or the bandwidth of {variant} is used if the server
+        doesn't declare them. Returns None if they're unknown """
+
+        segments = media.segments
+        if not segments:
+            return None
+        sampled = [segments[i * (len(segments) - 1) // max(samples - 1, 1)]
+                   for i in range(min(samples, len(segments)))]
+        # the size of a byte range is known already
+        sizes = [segment.byterange[1] if segment.byterange else self.head_size(segment.uri)
+                 for segment in sampled]
+        sampled_duration = sum(segment.duration for segment in sampled)
+        if all(size is not None for size in sizes) and sampled_duration > 0:
+            return int(sum(sizes) / sampled_duration * media.duration)
+        if variant and variant.bandwidth:
+            return variant.estimate_size(media.duration)
+        return None
+
+    def fingerprint(self, media: MediaPlaylist, edge: int = 2) -> str:
+        """ Returns a digest identifying the content of {media}, whatever
+        its URL: it covers its duration and the data of its first and
+        last {edge} segments, which are the only ones downloaded """
+
+        segments = media.segments
+        if len(segments) > 2 * edge:
+            segments = segments[:edge] + segments[-edge:]
+        if media.init:
+            segments = [media.init, *segments]
+        digest = hashlib.sha256(f"{round(media.duration)}\n".encode())
+        for segment in segments:
+            digest.update(hashlib.sha256(self.fetch(
+                segment.uri, segment.byterange)).digest())
+        return digest.hexdigest()
+
+    def measure_rate(self, manifest: str, media: MediaPlaylist | None = None) -> float | None:
+        """ Returns the bytes/s at which a segment of {manifest} is
+        downloaded by a single connection, if it has any segments.
+        Its {media} playlist is read, unless given """
+
+        segments = (media or self.get_media_playlist(manifest)).segments
+        if not segments:
+            return None
+        start = time.perf_counter()
+        size = len(self.fetch(segments[0].uri, segments[0].byterange))
+        return size / max(time.perf_counter() - start, 1e-3)
+
+    def get_media_playlist(self, manifest: str) -> MediaPlaylist:
+        """ Returns the media playlist of {manifest}, choosing the variant
+        through the selector if it is a master playlist """
+
+        return self.probe(manifest)[2]
+
+    def audio_rendition(self, variants: list[Variant], variant: Variant | None) -> Variant | None:
+        """ Returns the rendition among {variants} the audio of {variant}
+        has to be downloaded from, if it isn't in its stream """
+
+        if variant is None or variant.rendition or not variant.audio_group:
+            return None
+        renditions = [rendition for rendition in variants
+                      if rendition.rendition and rendition.audio_group == variant.audio_group]
+        return max(renditions, key=lambda rendition: rendition.default, default=None)
+
+    def iter_data(self, segments: list[Segment]) -> Iterator[bytes]:
+        """ Yields the data of {segments}, in order, while fetching them in
+        parallel. A bounded window of them is kept in flight: the first
+        one is always yielded before fetching too far ahead """
+
+        # the retries of the workers count in the phase of the caller
+        phase = metrics.current()
+
+        def fetch(segment: Segment) -> bytes:
+            with metrics.attach(phase):
+                return self.fetch(segment.uri, segment.byterange)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            window = deque()
+            segments_iter = iter(segments)
+            for segment in segments_iter:
+                window.append(executor.submit(fetch, segment))
+                if len(window) >= 2 * self.workers:
+                    break
+            try:
+                while window:
+                    yield window.popleft().result()
+                    segment = next(segments_iter, None)
+                    if segment is not None:
+                        window.append(executor.submit(fetch, segment))
+            except BaseException:
+                for future in window:
+                    future.cancel()
+                raise
+
+    def download(self, manifest: str, output_path: str) -> str:
+        """ Downloads the stream of {manifest} into {output_path}
+        (extension excluded) and returns the path of the written file """
+
+        variants, variant, media = self.probe(manifest)
+        if not media.segments:
+            raise HLSError(f"No segments found in {manifest}")
+        audio = self.audio_rendition(variants, variant)
+        if audio:
+            return self.download_with_audio(media, audio, output_path)
+        if self.stream:
+            return self.stream_download(media.all_segments, output_path)
+        return self.download_media(media, output_path)
+
+    def download_media(self, media: MediaPlaylist, output_path: str) -> str:
+        """ Downloads the segments of {media} into {output_path}
+        (extension excluded), resuming a previous attempt if any, and
+        returns the path of the written file """
+
+        segments = media.all_segments
+        final_path = f"{output_path}.{media.extension}"
+        part_path = final_path + ".part"
+
+        # the query is left out since it may contain per-session tokens
+        key = hashlib.sha1("\n".join(urllib.parse.urlparse(segment.uri).path +
+                                     (f"@{segment.byterange}" if segment.byterange else "")
+                                     for segment in segments).encode()).hexdigest()
+        checkpoint = Checkpoint(part_path + ".json", key)
+        done = verify_part(part_path, checkpoint.load())
+        if done:
+            self.logger.info(
+                f"Resuming {final_path} from segment {len(done)}/{len(segments)}")
+        else:
+            self.logger.info(
+                f"Downloading {len(media.segments)} segments into {final_path}")
+
+        with open(part_path, "ab") as output:
+            # whatever follows the last checked segment is discarded
+            output.truncate(sum(size for size, _ in done))
+            checkpoint.open(done)
+            try:
+                for data in self.iter_data(segments[len(done):]):
+                    output.write(data)
+                    output.flush()
+                    metrics.add("bytes", len(data))
+                    checkpoint.append(
+                        len(data), hashlib.sha1(data).hexdigest())
+            finally:
+                checkpoint.close()
+        os.replace(part_path, final_path)
+        checkpoint.remove()
+        return final_path
+
+    def download_with_audio(self, media: MediaPlaylist, audio: Variant, output_path: str) -> str:
+        """ Downloads the segments of {media} and the ones of its separate
+        {audio} rendition, then merges them into {output_path}.mp4 with
+        ffmpeg, and returns its path. Each of them is resumed on its own """
+
+        if shutil.which("ffmpeg") is None:
+            raise HLSError(
+                f"The audio of {output_path} is a separate stream, ffmpeg is needed to merge it")
+        audio_media = parse_media(self.fetch(audio.uri).decode(), audio.uri)
+        if not audio_media.segments:
+            raise HLSError(f"No segments found in {audio.uri}")
+        # streaming would need both of them piped at once
+        video_path = self.download_media(media, f"{output_path}.video")
+        audio_path = self.download_media(audio_media, f"{output_path}.audio")
+        final_path = f"{output_path}.mp4"
+        part_path = final_path + ".part"
+        self.logger.info(f"Merging the audio of {final_path}")
+        process = subprocess.run(["ffmpeg", "-y", "-v", "error", "-nostdin", "-i", video_path, "-i", audio_path,
+                                  "-map", "0:v", "-map", "1:a", "-c", "copy", "-f", "mp4", part_path],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            raise HLSError(
+                f"ffmpeg failed merging {final_path}: {process.stderr.strip()}")
+        os.replace(part_path, final_path)
+        os.remove(video_path)
+        os.remove(audio_path)
+        return final_path
+
+    def stream_download(self, segments: list[Segment], output_path: str) -> str:
+        """ Pipes {segments} into ffmpeg, which remuxes them into
+        {output_path}.mp4 on the fly, so that every byte is written to
+        disk once. Such downloads can't be resumed """
+
+        final_path = f"{output_path}.mp4"
+        part_path = final_path + ".part"
+        self.logger.info(
+            f"Streaming {len(segments)} segments into {final_path}")
+        process = subprocess.Popen(["ffmpeg", "-y", "-v", "error", "-i", "pipe:0", "-c", "copy", "-f", "mp4", part_path],
+                                   stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            for data in self.iter_data(segments):
+                process.stdin.write(data)
+                metrics.add("bytes", len(data))
+            _, errors = process.communicate()
+        except BaseException as e:
+            process.kill()
+            process.wait()
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            if isinstance(e, BrokenPipeError):
+                raise HLSError(
+                    f"ffmpeg stopped remuxing {final_path}: {process.stderr.read().decode().strip()}") from e
+            raise
+        if process.returncode != 0:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            raise HLSError(
+                f"ffmpeg failed remuxing {final_path}: {errors.decode().strip()}")
+        os.replace(part_path, final_path)
+        return final_path
@@ -0,0 +1,130 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+from json import load as json_load
+from json.decoder import JSONDecodeError
+import logging
+import os
+import sqlite3
+import threading
+
+SCHEMA_VERSION = 2
+
+
+class Ledger:
+    """ Persistent list of the downloaded videos, mapping each manifest
+    to the name it was downloaded with and, if known, to the fingerprint
+    of its content and the path of the downloaded file.
+    It is backed by an SQLite database: every update is a single atomic
+    transaction and several processes can safely share the same file. """
+
+    def __init__(self, path: str, legacy_path: str | None = None) -> None:
+        """ Opens (or creates) the ledger in {path}. When the ledger is
+        created, the downloaded list found in the json {legacy_path}
+        (the format used before the ledger) is imported into it """
+
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.lock = threading.Lock()
+        # writers wait for each other instead of failing immediately
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.connection:
+            # processes opening the ledger together migrate it only once
+            self.connection.execute("BEGIN IMMEDIATE")
+            version = self.connection.execute(
+                "PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self.connection.execute("""CREATE TABLE IF NOT EXISTS downloaded (
+                    manifest TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL)""")
+                if legacy_path:
+                    self.import_json(legacy_path)
+            if version < 2:
+                self.connection.execute(
+                    "ALTER TABLE downloaded ADD COLUMN fingerprint TEXT")
+                self.connection.execute(
+                    "ALTER TABLE downloaded ADD COLUMN path TEXT")
+                self.connection.execute(
+                    "CREATE INDEX downloaded_fingerprint ON downloaded (fingerprint)")
+            if version < SCHEMA_VERSION:
+                self.connection.execute(
+                    f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def import_json(self, legacy_path: str) -> None:
+        if not os.path.isfile(legacy_path) or not os.stat(legacy_path).st_size:
+            return
+        with open(legacy_path, "r") as legacy_file:
+            try:
+                legacy_dict = json_load(legacy_file)
+            except JSONDecodeError:
+                self.logger.warning(
+                    f"Error parsing downloaded json. Consider deleting {legacy_path}")
+                return
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO downloaded (manifest, filename) VALUES (?, ?)", legacy_dict.items())
+        self.logger.info(
+            f"Imported {len(legacy_dict)} videos from {legacy_path}")
+
+    def __contains__(self, manifest: str) -> bool:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM downloaded WHERE manifest = ?", (manifest,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM downloaded").fetchone()[0]
+
+    def items(self) -> list[tuple[str, str]]:
+        """ Returns the (manifest, filename) couples in insertion order """
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT manifest, filename FROM downloaded ORDER BY rowid").fetchall()
+
+    def find(self, fingerprint: str) -> tuple[str, str | None] | None:
+        """ Returns the filename and the path of the last video recorded
+        with {fingerprint}, if any """
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT filename, path FROM downloaded WHERE fingerprint = ? ORDER BY rowid DESC LIMIT 1",
+                (fingerprint,)).fetchone()
+
+    def add(self, manifest: str, filename: str, fingerprint: str | None = None, path: str | None = None) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO downloaded VALUES (?, ?, ?, ?)", (manifest, filename, fingerprint, path))
+
+    def remove(self, manifests: list[str]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM downloaded WHERE manifest = ?", [(manifest,) for manifest in manifests])
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self) -> Ledger:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
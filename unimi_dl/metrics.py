@@ -0,0 +1,174 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+from contextlib import contextmanager
+from datetime import datetime
+from json import dumps as json_dumps
+import os
+import threading
+import time
+from typing import Iterator
+
+
+class Phase:
+    """ A timed stage of a run (a login, a page fetch, a download...),
+    whose {fields} count what happened during it """
+
+    def __init__(self, name: str, labels: dict[str, str]) -> None:
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+        self.start = time.perf_counter()
+        # helper threads can count in the phase too, see {Metrics.attach}
+        self.lock = threading.Lock()
+
+    def add(self, field: str, amount: float = 1) -> None:
+        with self.lock:
+            self.fields[field] = self.fields.get(field, 0) + amount
+
+
+class Metrics:
+    """ Records the phases of a run as json lines in {path} and keeps
+    their totals, which can be exported as a Prometheus text file.
+    Until it is set up, phases are timed but not recorded anywhere. """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.file = None
+        self.prometheus_path = None
+        self.totals = {}
+
+    def setup(self, path: str | None = None, prometheus_path: str | None = None) -> None:
+        if path:
+            self.file = open(path, "a")
+        self.prometheus_path = prometheus_path
+
+    @contextmanager
+    def phase(self, name: str, **labels: str) -> Iterator[Phase]:
+        """ Times the body of the with statement as the phase {name}.
+        While it runs, {add} called by the same thread counts in it """
+
+        phase = Phase(name, labels)
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(phase)
+        status = "ok"
+        try:
+            yield phase
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            stack.remove(phase)
+            self.record(phase, time.perf_counter() - phase.start, status)
+
+    def current(self) -> Phase | None:
+        """ Returns the innermost phase running in the calling thread """
+
+        stack = self.local.__dict__.get("stack")
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def attach(self, phase: Phase | None) -> Iterator[None]:
+        """ Lets {add} called by the calling thread, within the with
+        statement, count in {phase}, which runs in another thread """
+
+        if phase is None:
+            yield
+            return
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(phase)
+        try:
+            yield
+        finally:
+            stack.remove(phase)
+
+    def add(self, field: str, amount: float = 1) -> None:
+        """ Adds {amount} to {field} of the innermost phase running
+        in the calling thread, if any """
+
+        stack = self.local.__dict__.get("stack")
+        if stack:
+            stack[-1].add(field, amount)
+
+    def record(self, phase: Phase, duration: float, status: str) -> None:
+        entry = {"time": datetime.now().isoformat(), "phase": phase.name, **phase.labels,
+                 "status": status, "duration": duration, **phase.fields}
+        if "bytes" in phase.fields and duration > 0:
+            entry["bytes/s"] = phase.fields["bytes"] / duration
+        with self.lock:
+            totals = self.totals.setdefault(phase.name, {})
+            totals["count"] = totals.get("count", 0) + 1
+            totals["seconds"] = totals.get("seconds", 0) + duration
+            if status != "ok":
+                totals["errors"] = totals.get("errors", 0) + 1
+            for field, amount in phase.fields.items():
+                totals[field] = totals.get(field, 0) + amount
+            if self.file:
+                self.file.write(json_dumps(entry) + "\n")
+                self.file.flush()
+
+    def pop_totals(self) -> dict[str, dict[str, float]]:
+        """ Returns the totals of every phase recorded so far, and starts
+        counting again from zero """
+
+        with self.lock:
+            totals, self.totals = self.totals, {}
+        return totals
+
+    def merge(self, totals: dict[str, dict[str, float]]) -> None:
+        """ Adds {totals}, returned by {pop_totals} in another process,
+        to the totals of this one """
+
+        with self.lock:
+            for phase, fields in totals.items():
+                merged = self.totals.setdefault(phase, {})
+                for field, amount in fields.items():
+                    merged[field] = merged.get(field, 0) + amount
+
+    def write_prometheus(self) -> None:
+        """ Writes the totals of every phase in the Prometheus text
+        format, replacing the file atomically """
+
+        with self.lock:
+            names = sorted(set(field for totals in self.totals.values()
+                               for field in totals))
+            lines = []
+            for field in names:
+                metric = "unimi_dl_phase_" + \
+                    field.replace("/", "_per_").replace("-", "_") + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                for phase, totals in sorted(self.totals.items()):
+                    if field in totals:
+                        lines.append(
+                            f"{metric}{{phase=\"{phase}\"}} {totals[field]}")
+        tmp_path = f"{self.prometheus_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as prometheus_file:
+            prometheus_file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+    def close(self) -> None:
+        if self.prometheus_path:
+            self.write_prometheus()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+metrics = Metrics()
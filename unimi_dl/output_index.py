@@ -0,0 +1,154 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+
+# leftovers of interrupted downloads, which don't count as present
+PARTIAL_SUFFIXES = (".part", ".part.json", ".ytdl", ".temp")
+# what a download can produce: the native engine's streams, audio-only
+# ones included, and youtube-dl's containers. Anything else sharing the
+# name, like the extracted thumbnails, isn't the video
+MEDIA_EXTENSIONS = (".mp4", ".m4v", ".mkv", ".webm", ".mov", ".flv", ".ts",
+                    ".aac", ".ac3", ".ec3", ".m4a", ".mp3", ".opus")
+
+
+def probe_duration(path: str) -> float | None:
+    """ Returns the duration in seconds of the media in {path} according
+    to ffprobe, or None if it can't be determined """
+
+    try:
+        result = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                                 "-of", "default=noprint_wrappers=1:nokey=1", path],
+                                capture_output=True, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+class OutputIndex:
+    """ Cached index of the files in the output directories (name, size,
+    mtime and, optionally, media duration), so that the videos already
+    present on disk are recognized without listing and statting every
+    file on each run. A directory is scanned again only when its mtime
+    changes, and only its new or modified files are probed. """
+
+    def __init__(self, path: str, probe: bool = False) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.probe = probe and shutil.which("ffprobe") is not None
+        if probe and not self.probe:
+            self.logger.warning("ffprobe not found, durations won't be probed")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS directories (
+                directory TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                stem TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                duration REAL,
+                PRIMARY KEY (directory, name))""")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_stem ON files (directory, stem)")
+
+    def refresh(self, directory: str) -> None:
+        """ Brings the index of {directory} up to date, scanning it
+        only if it changed since the last time """
+
+        directory = os.path.realpath(directory)
+        mtime = os.stat(directory).st_mtime_ns
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT mtime FROM directories WHERE directory = ?", (directory,)).fetchone()
+            if row and row[0] == mtime:
+                return
+            indexed = {name: (size, file_mtime) for name, size, file_mtime in self.connection.execute(
+                "SELECT name, size, mtime FROM files WHERE directory = ?", (directory,))}
+
+        self.logger.info(f"Indexing {directory}")
+        present = set()
+        updates = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith(PARTIAL_SUFFIXES):
+                    continue
+                present.add(entry.name)
+                stat = entry.stat()
+                if indexed.get(entry.name) != (stat.st_size, stat.st_mtime_ns):
+                    updates.append(self.describe(directory, entry.name, stat))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", updates)
+            self.connection.executemany("DELETE FROM files WHERE directory = ? AND name = ?",
+                                        [(directory, name) for name in set(indexed) - present])
+            self.connection.execute(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?)", (directory, mtime))
+
+    def describe(self, directory: str, name: str, stat: os.stat_result) -> tuple:
+        duration = probe_duration(os.path.join(
+            directory, name)) if self.probe else None
+        return (directory, name, os.path.splitext(name)[0], stat.st_size, stat.st_mtime_ns, duration)
+
+    def add(self, path: str) -> None:
+        """ Indexes the file just written in {path}, without scanning
+        its whole directory again """
+
+        directory, name = os.path.split(os.path.realpath(path))
+        entry = self.describe(directory, name, os.stat(path))
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", entry)
+            self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?)",
+                                    (directory, os.stat(directory).st_mtime_ns))
+
+    def find(self, directory: str, stem: str) -> str | None:
+        """ Returns the name of a complete file in {directory} named {stem}
+        plus one of {MEDIA_EXTENSIONS}, if any. Empty files don't count,
+        and neither do files which were probed without finding a duration """
+
+        directory = os.path.realpath(directory)
+        with self.lock:
+            rows = self.connection.execute("SELECT name, size, duration FROM files WHERE directory = ? AND stem = ?",
+                                           (directory, stem)).fetchall()
+        for name, size, duration in rows:
+            if not name.lower().endswith(MEDIA_EXTENSIONS):
+                continue
+            if size > 0 and (not self.probe or duration):
+                return name
+        return None
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self) -> OutputIndex:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
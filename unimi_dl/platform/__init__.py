@@ -16,8 +16,33 @@
 # along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from .getPlatform import getPlatform
-from .ariel import Ariel
-from .panopto import Panopto
+from importlib import import_module
 
-__all__ = ["ariel", "getPlatform", "panopto", "platform"]
+__all__ = ["ariel", "async_client", "getPlatform", "page_cache", "panopto", "platform", "session_cache"]
+
+# the platforms depend on requests: they are imported when first
+# accessed, so that importing a lightweight module of this package
+# (e.g. the session cache) doesn't pay for it
+_exports = {
+    "AsyncClient": ".async_client",
+    "Ariel": ".ariel",
+    "PageCache": ".page_cache",
+    "Panopto": ".panopto",
+    "SessionCache": ".session_cache",
+    "aget_all_manifests": ".getPlatform",
+    "agetPlatform": ".getPlatform",
+    "getPlatform": ".getPlatform",
+}
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}")
+    module = import_module(_exports[name], __name__)
+    # importing a submodule binds it in this package: the getPlatform
+    # submodule must not shadow the function with the same name
+    for export, module_name in _exports.items():
+        if module_name == _exports[name]:
+            globals()[export] = getattr(module, export)
+    return globals()[name]
@@ -17,44 +17,169 @@
 
 
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 import re
+from typing import Iterable, Iterator
 import urllib.parse
 
 import requests
 
-from .platform import Platform
+from ..metrics import metrics
+from ..retry import REQUEST_TIMEOUT
+from .page_cache import PageCache
+from .platform import LoginRequiredError, Platform, is_login_page
+from .session_cache import SessionCache
+
+
+LOGIN_URL = "https://elearning.unimi.it/authentication/skin/portaleariel/login.aspx?url=https://ariel.unimi.it/"
+MANIFEST_RE = re.compile(r"https?://.*?/mp4:.*?([^/]*?)\.mp4/manifest.m3u8")
+LINK_RE = re.compile(r"""href\s*=\s*["']([^"'#]+)""", re.IGNORECASE)
+# links the crawler must not follow: logging out would end the session,
+# and files other than pages can't link to videos
+SKIPPED_LINK_RE = re.compile(
+    r"log-?out|log-?off|sign-?out|\.(pdf|zip|rar|7z|docx?|pptx?|xlsx?|jpe?g|png|gif|mp[34]|m3u8|css|js)$", re.IGNORECASE)
 
 
 def get_ariel_session(email: str, password: str) -> requests.Session:
     s = requests.Session()
-    login_url = 'https://elearning.unimi.it/authentication/skin/portaleariel/login.aspx?url=https://ariel.unimi.it/'
     payload = {'hdnSilent': 'true',
                'tbLogin': email,
                'tbPassword': password}
-    s.post(login_url, data=payload)
+    s.post(LOGIN_URL, data=payload, timeout=REQUEST_TIMEOUT)
     return s
 
 
 class Ariel(Platform):
-    def __init__(self, email: str, password: str) -> None:
-        super().__init__(email, password)
+    name = "ariel"
+    # when set, {iter_manifests} crawls the course from the given URL
+    crawl_depth: int | None = None
+    crawl_hosts: list[str] = []
+
+    def __init__(self, email: str, password: str, session_cache: SessionCache | None = None, page_cache: PageCache | None = None) -> None:
+        super().__init__(email, password, session_cache, page_cache)
         self.logger = logging.getLogger(__name__)
-        self.logger.info("Logging in")
-        self.session = get_ariel_session(email, password)
+        self.session = self.open_session()
+
+    def new_session(self) -> requests.Session:
+        return get_ariel_session(self.email, self.password)
+
+    def logged_out(self, response: requests.Response) -> bool:
+        return is_login_page(response, LOGIN_URL)
 
     def get_manifests(self, url: str) -> dict[str, str]:
+        return dict(self.iter_manifests(url))
+
+    def iter_manifests(self, url: str) -> Iterator[tuple[str, str]]:
+        if self.crawl_depth is not None:
+            yield from self.crawl(url, self.crawl_depth, self.crawl_hosts)
+            return
         self.logger.info("Getting video page")
-        video_page = self.session.get(url).text
+        session = self.session
+        try:
+            yield from self.iter_page_manifests(url, lambda response: self.scan_manifests(iter_text(response), url))
+        except LoginRequiredError:
+            if not self.relogin(session):
+                raise
+            yield from self.iter_manifests(url)
+
+    def crawl(self, root: str, depth: int = 2, hosts: Iterable[str] = (), jobs: int = 8) -> Iterator[tuple[str, str]]:
+        """ Yields the (title, manifest) couples found in the pages of the
+        course at {root}, without duplicates. The pages are visited
+        breadth-first, up to {depth} links away from {root}, following
+        only links to the host of {root} or to {hosts}; the pages at the
+        same depth are fetched concurrently by {jobs} workers """
+
+        hosts = {urllib.parse.urlparse(root).hostname, *hosts}
+        session = self.session
+        visited = {root}
+        level = [root]
+        titles = set()
+        known = set()
+        logged_out = False
+        for distance in range(depth + 1):
+            self.logger.info(
+                f"Crawling {len(level)} pages {distance} links away from {root}")
+            following = []
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(
+                    self.crawl_page, url): url for url in level}
+                for future in as_completed(futures):
+                    try:
+                        couples, links = future.result()
+                    except requests.RequestException as e:
+                        logged_out |= isinstance(e, LoginRequiredError)
+                        self.logger.warning(f"Failed crawling {futures[future]}")
+                        self.logger.debug(e)
+                        continue
+                    for title, manifest in couples:
+                        if manifest in known:
+                            continue
+                        while title in titles:
+                            title += "_other"
+                        titles.add(title)
+                        known.add(manifest)
+                        yield title, manifest
+                    for link in links:
+                        if link not in visited and urllib.parse.urlparse(link).hostname in hosts:
+                            visited.add(link)
+                            following.append(link)
+            level = following
+            if not level:
+                break
+        # the videos already found are found again, and left out by the
+        # callers, which drop the duplicate manifests
+        if logged_out and self.relogin(session):
+            yield from self.crawl(root, depth, hosts, jobs)
+
+    def crawl_page(self, url: str) -> tuple[list[tuple[str, str]], list[str]]:
+        """ Returns the (title, manifest) couples found in the page at
+        {url} and the links it contains, resolved and without fragment """
+
+        with metrics.phase("page_fetch", platform=self.name, url=url) as phase:
+            response = self.get(url)
+            phase.labels["http_status"] = str(response.status_code)
+        response.raise_for_status()
+        if "html" not in response.headers.get("Content-Type", "text/html"):
+            return [], []
+        page = response.text
+        links = []
+        for link in LINK_RE.findall(page):
+            link = urllib.parse.urljoin(url, link.strip())
+            parsed = urllib.parse.urlparse(link)
+            if parsed.scheme in ["http", "https"] and not any(
+                    SKIPPED_LINK_RE.search(part) for part in [parsed.path, parsed.query]):
+                links.append(link)
+        return list(self.scan_manifests([page], url)), links
+
+    def scan_manifests(self, chunks: Iterable[str], url: str) -> Iterator[tuple[str, str]]:
+        """ Yields the (title, manifest) couples found in the page at {url},
+        received as a sequence of text {chunks}, as soon as they're found """
 
         self.logger.info("Collecting manifests and video names")
-        res = {}
-        manifest_re = re.compile(
-            r"https://.*?/mp4:.*?([^/]*?)\.mp4/manifest.m3u8")
-        for i, manifest in enumerate(manifest_re.finditer(video_page)):
-            title = urllib.parse.unquote(
-                manifest[1]) if manifest[1] else urllib.parse.urlparse(url)[1]+str(i)
-            while title in res:
-                title += "_other"
-            res[title] = manifest[0]
-        return res
+        titles = set()
+        i = 0
+        buffer = ""
+        for chunk in chunks:
+            buffer += chunk
+            end = 0
+            for manifest in MANIFEST_RE.finditer(buffer):
+                title = urllib.parse.unquote(
+                    manifest[1]) if manifest[1] else urllib.parse.urlparse(url)[1]+str(i)
+                while title in titles:
+                    title += "_other"
+                titles.add(title)
+                i += 1
+                end = manifest.end()
+                yield title, manifest[0]
+            # a match never spans across lines nor overlaps a previous one,
+            # so only what follows both has to be kept for the next chunk
+            buffer = buffer[max(end, buffer.rfind("\n") + 1):]
+
+
+def iter_text(response: requests.Response, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """ Yields the body of the streamed {response} as decoded chunks """
+
+    if response.encoding is None:
+        response.encoding = "utf-8"
+    yield from response.iter_content(chunk_size=chunk_size, decode_unicode=True)
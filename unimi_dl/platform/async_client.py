@@ -0,0 +1,62 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class AsyncClient:
+    """ Connection-limited client used by the asynchronous Platform API.
+    Blocking calls (requests, logins, page scans) are run by a fixed pool
+    of {limit} workers shared by every platform using the client, so that
+    any number of coroutines can wait on them from a single event loop
+    while at most {limit} connections are open at any time. """
+
+    def __init__(self, limit: int = 16) -> None:
+        self.limit = limit
+        self.executor = ThreadPoolExecutor(
+            max_workers=limit, thread_name_prefix="unimi-dl-client")
+
+    def mount(self, session: requests.Session) -> None:
+        """ Lets {session} keep a connection open for every worker """
+
+        adapter = HTTPAdapter(pool_connections=self.limit,
+                              pool_maxsize=self.limit)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    async def run(self, function: Callable, *args, **kwargs) -> Any:
+        """ Awaits {function} called with {args} and {kwargs} by a worker """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> AsyncClient:
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        self.close()
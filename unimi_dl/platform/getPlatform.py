@@ -17,17 +17,48 @@
 
 from __future__ import annotations
 
+import asyncio
+
 from .ariel import Ariel
+from .async_client import AsyncClient
 from .panopto import Panopto
+from .page_cache import PageCache
 from .platform import Platform
+from .session_cache import SessionCache
 
 
-def getPlatform(email: str, password: str, platform: str) -> Platform:
+def getPlatform(email: str, password: str, platform: str, session_cache: SessionCache | None = None, page_cache: PageCache | None = None) -> Platform:
     """ Factory method to create the appropriate Platform instance. """
 
     if platform == 'ariel':
-        return Ariel(email, password)
+        return Ariel(email, password, session_cache, page_cache)
     if platform == 'panopto':
-        return Panopto(email, password)
+        return Panopto(email, password, session_cache, page_cache)
 
     raise NotImplementedError
+
+
+async def agetPlatform(email: str, password: str, platform: str, client: AsyncClient, session_cache: SessionCache | None = None, page_cache: PageCache | None = None) -> Platform:
+    """ Asynchronous counterpart of getPlatform, logging in through {client}
+    unless a valid session is in {session_cache}. """
+
+    instance = await client.run(getPlatform, email, password, platform, session_cache, page_cache)
+    client.mount(instance.session)
+    return instance
+
+
+async def aget_all_manifests(platform: Platform, urls: list[str], client: AsyncClient) -> dict[str, dict[str, str]]:
+    """ Returns the manifests found in each of {urls}, fetched concurrently
+    by {platform} through {client}. Pages which couldn't be fetched are
+    left out. """
+
+    results = await asyncio.gather(*[platform.aget_manifests(url, client) for url in urls],
+                                   return_exceptions=True)
+    all_manifests = {}
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            platform.logger.error(f"Failed getting {url}")
+            platform.logger.debug(result)
+        else:
+            all_manifests[url] = result
+    return all_manifests
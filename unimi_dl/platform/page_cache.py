@@ -0,0 +1,95 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+from json import dumps as json_dumps, loads as json_loads
+import sqlite3
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+SCHEMA_VERSION = 1
+
+
+class PageCache:
+    """ On-disk cache of the pages manifests are collected from.
+    For each URL it keeps the validators sent by the server (ETag and
+    Last-Modified) together with the manifests parsed from the page, so
+    that an unchanged page is neither downloaded nor parsed again.
+    Each account, identified by the session key of its platform, has
+    its own entries, since the same page may show each one different
+    videos. """
+
+    def __init__(self, path: str) -> None:
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            version = self.connection.execute(
+                "PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # the entries of the older versions weren't per account:
+                # being a cache, they're simply dropped
+                self.connection.execute("DROP TABLE IF EXISTS pages")
+                self.connection.execute("""CREATE TABLE pages (
+                    account TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    manifests TEXT NOT NULL,
+                    PRIMARY KEY (account, url))""")
+                self.connection.execute(
+                    f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def get_headers(self, account: str, url: str) -> dict[str, str]:
+        """ Returns the headers making the request for {url} by {account}
+        conditional """
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified FROM pages WHERE account = ? AND url = ?", (account, url)).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def get_manifests(self, account: str, url: str) -> dict[str, str] | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT manifests FROM pages WHERE account = ? AND url = ?", (account, url)).fetchone()
+        return json_loads(row[0]) if row else None
+
+    def store(self, account: str, url: str, response: requests.Response, manifests: dict[str, str]) -> None:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            # the server doesn't support conditional requests
+            return
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                                    (account, url, etag, last_modified, json_dumps(manifests)))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
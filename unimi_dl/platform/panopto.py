@@ -17,7 +17,9 @@
 
 
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import os
 import re
 
 import requests
@@ -25,37 +27,131 @@ from urllib3 import disable_warnings
 import urllib.parse
 from urllib3.exceptions import InsecureRequestWarning
 
+from ..retry import REQUEST_TIMEOUT
 from .ariel import get_ariel_session
-from .platform import Platform
+from .page_cache import PageCache
+from .platform import LoginRequiredError, Platform, is_login_page
+from .session_cache import SessionCache
+
+
+AUTH_URL = "https://unimi.cloud.panopto.eu/Panopto/Pages/Auth/Login.aspx?instance=Labonline"
+# e.g. .../Panopto/Pages/Sessions/List.aspx#folderID="<id>", quotes escaped or not
+FOLDER_RE = re.compile(r"folderID=(?:%22|\")?([0-9a-f-]{36})", re.IGNORECASE)
+SESSIONS_PATH = "/Panopto/Services/Data.svc/GetSessions"
+DELIVERY_INFO_PATH = "/Panopto/Pages/Viewer/DeliveryInfo.aspx"
+
+
+def safe_filename(name: str) -> str:
+    """ Returns {name}, given by the server, usable as a file name: the
+    path separators in it, as in the dates, are replaced with dashes """
+
+    for separator in set(["/", "\\", os.sep, os.altsep]) - set([None]):
+        name = name.replace(separator, "-")
+    return name
 
 
 def get_panopto_session(email: str, password: str) -> requests.Session:
     s = get_ariel_session(email, password)
-    auth_url = r"https://unimi.cloud.panopto.eu/Panopto/Pages/Auth/Login.aspx?instance=Labonline"
     disable_warnings(InsecureRequestWarning)
-    s.get(auth_url, verify=False)
+    s.get(AUTH_URL, verify=False, timeout=REQUEST_TIMEOUT)
     return s
 
 
 class Panopto(Platform):
-    def __init__(self, email: str, password: str) -> None:
-        super().__init__(email, password)
+    name = "panopto"
+
+    def __init__(self, email: str, password: str, session_cache: SessionCache | None = None, page_cache: PageCache | None = None) -> None:
+        super().__init__(email, password, session_cache, page_cache)
         self.logger = logging.getLogger(__name__)
-        self.logger.info("Logging in")
-        self.session = get_panopto_session(email, password)
+        self.session = self.open_session()
+
+    def new_session(self) -> requests.Session:
+        return get_panopto_session(self.email, self.password)
+
+    def logged_out(self, response: requests.Response) -> bool:
+        return is_login_page(response, AUTH_URL)
 
     def get_manifests(self, url: str) -> dict[str, str]:
-        self.logger.info("Getting video page")
-        video_page = self.session.get(url).text
+        session = self.session
+        try:
+            if FOLDER_RE.search(url):
+                return self.get_folder_manifests(url)
+            self.logger.info("Getting video page")
+            return self.fetch_manifests(
+                url, lambda video_page: self.get_iframe_manifests(video_page, url))
+        except LoginRequiredError:
+            if not self.relogin(session):
+                raise
+            return self.get_manifests(url)
+
+    def get_folder_manifests(self, url: str, page_size: int = 100, jobs: int = 8) -> dict[str, str]:
+        """ Returns the manifests of all the sessions in the folder at
+        {url}: the sessions are listed {page_size} at a time, then the
+        delivery info of {jobs} of them at a time is requested """
+
+        parsed = urllib.parse.urlparse(url)
+        base = url[:url.index("/Panopto/")] if "/Panopto/" in url else f"{parsed.scheme}://{parsed.netloc}"
+        folder = FOLDER_RE.search(url)[1]
+        self.logger.info(f"Listing the sessions of folder {folder}")
+        sessions = {}
+        page_index = 0
+        while True:
+            # the sessions are paged by index, not by offset
+            response = self.post(base + SESSIONS_PATH, json={"queryParameters": {
+                "folderID": folder, "page": page_index, "maxResults": page_size,
+                "sortColumn": 1, "sortAscending": True, "getFolderData": True}})
+            response.raise_for_status()
+            page = response.json()["d"]
+            new = {session["DeliveryID"]: session for session in page["Results"]
+                   if session["DeliveryID"] not in sessions}
+            sessions.update(new)
+            # a server ignoring the page would return the same sessions
+            # over and over
+            if not new or len(sessions) >= page["TotalNumber"]:
+                break
+            page_index += 1
+        sessions = list(sessions.values())
+        self.logger.info(f"Collecting the manifests of {len(sessions)} sessions")
 
+        def get_stream(session: dict) -> str | None:
+            response = self.post(base + DELIVERY_INFO_PATH, data={
+                "deliveryId": session["DeliveryID"], "responseType": "json"})
+            response.raise_for_status()
+            delivery = response.json().get("Delivery") or {}
+            # the podcast stream has every source already mixed in
+            for stream in delivery.get("PodcastStreams") or delivery.get("Streams") or []:
+                if stream.get("StreamUrl"):
+                    return stream["StreamUrl"]
+            return None
+
+        manifests = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for session, stream in zip(sessions, executor.map(get_stream, sessions)):
+                if not stream:
+                    self.logger.info(
+                        f"No stream found for {session['SessionName']}")
+                    continue
+                filename = safe_filename(session["SessionName"])
+                while filename in manifests:
+                    filename += "_other"
+                manifests[filename] = stream
+        return manifests
+
+    def get_iframe_manifests(self, video_page: str, url: str) -> dict[str, str]:
         iframe_re = re.compile(r"<iframe src=\"(.*?)\"")
-        iframe_url = iframe_re.search(video_page)[1]
+        iframe_match = iframe_re.search(video_page)
+        if not iframe_match:
+            self.logger.info("No video found")
+            return {}
+        iframe_url = iframe_match[1]
         self.logger.debug(f"iframe URL: {iframe_url}")
-        manifest_page = self.session.get(iframe_url).text
+        return self.fetch_manifests(
+            iframe_url, lambda manifest_page: self.parse_manifest(manifest_page, url))
 
+    def parse_manifest(self, manifest_page: str, url: str) -> dict[str, str]:
         self.logger.info("Collecting manifests")
         manifest = re.compile(
-            r"\"VideoUrl\":\"(https:.*?\.m3u8)\"").search(manifest_page)
+            r"\"VideoUrl\":\"(https?:.*?\.m3u8)\"").search(manifest_page)
         if not manifest:
             self.logger.info("No manifest found")
             return {}
@@ -64,7 +160,7 @@ class Panopto(Platform):
         filename_match = re.compile(
             r"<title>(.*?)</title>").search(manifest_page)
 
-        filename = filename_match[1] if filename_match and filename_match[1] else urllib.parse.urlparse(url)[
+        filename = safe_filename(filename_match[1]) if filename_match and filename_match[1] else urllib.parse.urlparse(url)[
             1]
 
         return {filename: manifest[1].replace("\\", "")}
@@ -17,15 +17,189 @@
 
 
 from __future__ import annotations
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+import urllib.parse
+
+import requests
+
+from ..metrics import metrics
+from ..retry import REQUEST_TIMEOUT, retrier
+from .page_cache import PageCache
+from .session_cache import SessionCache
+
+if TYPE_CHECKING:
+    from .async_client import AsyncClient
+
+
+class LoginRequiredError(requests.RequestException):
+    """ Raised when a page is redirected to the login form: the session
+    isn't valid anymore """
+
+
+def is_login_page(response: requests.Response, *login_urls: str) -> bool:
+    """ Returns whether {response} landed, after the redirects, on the
+    login form at one of {login_urls} """
+
+    landed = urllib.parse.urlparse(response.url)
+    return any((landed.netloc.lower(), landed.path.lower()) == (login.netloc.lower(), login.path.lower())
+               for login in map(urllib.parse.urlparse, login_urls))
 
 
 class Platform:
-    def __init__(self, email: str, password: str) -> None:
+    name = ""
+    # when set, even a session which wasn't cached is replaced when a
+    # page is redirected to the login, since it may have expired in the
+    # meantime, but at most once every {relogin_interval} seconds (see
+    # {relogin})
+    relogin_interval: float | None = None
+
+    def __init__(self, email: str, password: str, session_cache: SessionCache | None = None, page_cache: PageCache | None = None) -> None:
         self.email = email
         self.password = password
+        self.session_cache = session_cache
+        self.page_cache = page_cache
+        self.session_key = SessionCache.get_key(self.name, email)
+        # whether the current session was restored from {session_cache}
+        self.session_cached = False
+        # the pages of the platform are scanned concurrently: their
+        # workers log in again one at a time
+        self.relogin_lock = threading.Lock()
+        self.last_login = 0.0
+
+    def new_session(self) -> requests.Session:
+        """ Returns a freshly logged in session """
+
+        raise NotImplementedError
+
+    def open_session(self) -> requests.Session:
+        """ Returns the session stored in the cache, if still valid,
+        or a freshly logged in one otherwise """
+
+        jar = self.session_cache.load(
+            self.session_key) if self.session_cache else None
+        if jar is not None:
+            self.logger.info("Reusing cached session")
+            session = requests.Session()
+            session.cookies.update(jar)
+            self.session_cached = True
+            return session
+
+        self.logger.info("Logging in")
+        with metrics.phase("login", platform=self.name):
+            session = self.new_session()
+        self.last_login = time.monotonic()
+        if self.session_cache:
+            self.session_cache.store(self.session_key, session.cookies)
+        self.session_cached = False
+        return session
+
+    def logged_out(self, response: requests.Response) -> bool:
+        """ Returns whether {response} shows that the session isn't
+        valid anymore, as the login form does """
+
+        return False
+
+    def relogin(self, session: requests.Session) -> bool:
+        """ Replaces {session}, with which a page was redirected to the
+        login, with a new one if it was restored from the cache, since it
+        may have been invalidated by the server, or if {relogin_interval}
+        passed since the last login.
+        Returns whether the page should be requested again: also when
+        another worker already replaced {session} in the meantime """
+
+        with self.relogin_lock:
+            if self.session is not session:
+                return True
+            if self.session_cached:
+                self.logger.info("The cached session seems to be invalid")
+            elif self.relogin_interval is not None and time.monotonic() - self.last_login >= self.relogin_interval:
+                self.logger.info("The session seems to have expired")
+            else:
+                return False
+            if self.session_cache:
+                self.session_cache.invalidate(self.session_key)
+            self.session = self.open_session()
+            return True
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """ Requests {url} with the session, retrying on transient
+        failures, server side errors included.
+        Raises LoginRequiredError if the session isn't valid """
+
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+
+        def attempt() -> requests.Response:
+            response = self.session.request(method, url, **kwargs)
+            if response.status_code >= 500 or response.status_code == 429:
+                response.raise_for_status()
+            return response
+
+        response = retrier.call(url, attempt)
+        if self.logged_out(response):
+            raise LoginRequiredError(
+                f"{url} redirected to the login", response=response)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def iter_page_manifests(self, url: str, scan: Callable[[requests.Response], Iterable[tuple[str, str]]]) -> Iterator[tuple[str, str]]:
+        """ Yields the (filename, manifest) couples found by {scan} in the
+        streamed response for {url}, as soon as it finds them.
+        If the page didn't change since its manifests were cached, these
+        are yielded without downloading and scanning the page again """
+
+        headers = self.page_cache.get_headers(
+            self.session_key, url) if self.page_cache else {}
+        with metrics.phase("page_fetch", platform=self.name, url=url) as phase:
+            response = self.get(url, headers=headers, stream=True)
+            phase.labels["http_status"] = str(response.status_code)
+        if response.status_code == 304:
+            manifests = self.page_cache.get_manifests(self.session_key, url)
+            if manifests is not None:
+                self.logger.info("The page didn't change since last time")
+                yield from manifests.items()
+                return
+            response = self.get(url, stream=True)
+
+        manifests = {}
+        # since the page is streamed, this includes receiving its body
+        with metrics.phase("extraction", platform=self.name, url=url) as phase:
+            for filename, manifest in scan(response):
+                manifests[filename] = manifest
+                phase.add("videos")
+                yield filename, manifest
+        # pages without videos are cached too: the login is told apart
+        # by its redirect, not by its lack of videos
+        if self.page_cache:
+            self.page_cache.store(self.session_key, url, response, manifests)
+
+    def fetch_manifests(self, url: str, parse: Callable[[str], dict[str, str]]) -> dict[str, str]:
+        """ Returns the manifests found by {parse} in the whole page at
+        {url}, going through the page cache like {iter_page_manifests} """
+
+        return dict(self.iter_page_manifests(url, lambda response: parse(response.text).items()))
 
     def get_manifests(self, url: str) -> dict[str, str]:
         """ Returns a list of couples, each one containing a filename and relative
         manifest, fetched from {url} """
 
         raise NotImplementedError
+
+    def iter_manifests(self, url: str) -> Iterator[tuple[str, str]]:
+        """ Yields the couples returned by {get_manifests}. Platforms able
+        to find them while the page is still being downloaded override it
+        to yield each couple as soon as it's found """
+
+        yield from self.get_manifests(url).items()
+
+    async def aget_manifests(self, url: str, client: AsyncClient) -> dict[str, str]:
+        """ Asynchronous counterpart of {get_manifests}, whose requests
+        are performed through {client} """
+
+        return await client.run(self.get_manifests, url)
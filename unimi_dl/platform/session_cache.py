@@ -0,0 +1,107 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+import hashlib
+from json import dumps as json_dumps, load as json_load
+from json.decoder import JSONDecodeError
+import logging
+import os
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from requests.cookies import RequestsCookieJar
+
+
+class SessionCache:
+    """ Stores the cookies of authenticated sessions on disk, so that
+    the following runs can reuse them instead of logging in again.
+    Every entry expires {ttl} seconds after the login. """
+
+    def __init__(self, path: str, ttl: int = 3600) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def get_key(platform: str, email: str) -> str:
+        # the password is left out: nothing derived from it is stored
+        # unless the credentials are saved
+        return hashlib.sha256(f"{platform}\n{email}".encode()).hexdigest()
+
+    def read(self) -> dict:
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, "r") as cache_file:
+            try:
+                return json_load(cache_file)
+            except JSONDecodeError:
+                self.logger.warning("Error parsing the session cache")
+                return {}
+
+    def write(self, entries: dict) -> None:
+        # written aside and then renamed, so that it's never left
+        # half-written; cookies are as secret as the credentials
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as cache_file:
+            cache_file.write(json_dumps(entries))
+        os.replace(tmp_path, self.path)
+
+    def load(self, key: str) -> RequestsCookieJar | None:
+        """ Returns the cookies stored under {key},
+        or None if there are none or they expired """
+
+        from requests.cookies import RequestsCookieJar, create_cookie
+
+        entry = self.read().get(key)
+        now = time.time()
+        if not entry or entry["expires"] <= now:
+            return None
+        jar = RequestsCookieJar()
+        for cookie in entry["cookies"]:
+            if cookie["expires"] is not None and cookie["expires"] <= now:
+                return None
+            jar.set_cookie(create_cookie(**cookie))
+        return jar
+
+    def store(self, key: str, jar: RequestsCookieJar) -> None:
+        now = time.time()
+        entries = {key: entry for key, entry in self.read().items()
+                   if entry["expires"] > now}
+        entries[key] = {
+            "expires": now + self.ttl,
+            "cookies": [{
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "secure": cookie.secure,
+                "expires": cookie.expires,
+            } for cookie in jar]
+        }
+        self.write(entries)
+
+    def invalidate(self, key: str) -> None:
+        entries = self.read()
+        if entries.pop(key, None) is not None:
+            self.write(entries)
+
+    def wipe(self) -> None:
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -0,0 +1,126 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import os
+import shutil
+import subprocess
+
+from .metrics import metrics
+
+ENCODERS = {"h264": "libx264", "h265": "libx265"}
+
+
+class PostProcessError(Exception):
+    pass
+
+
+class PostProcessor:
+    """ Second stage of the download pipeline: the downloaded files are
+    remuxed into mp4, optionally re-encoded with {reencode} (one of
+    {ENCODERS}), and given a thumbnail, while the following videos are
+    still being downloaded.
+    The work is done by ffmpeg processes, up to {workers} at a time, so
+    that all the cores are used without holding the downloads back. """
+
+    def __init__(self, remux: bool = True, reencode: str | None = None, thumbnail: bool = False, workers: int | None = None) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.remux = remux or reencode is not None
+        self.reencode = reencode
+        self.thumbnail = thumbnail
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or os.cpu_count())
+        self.futures = set()
+
+    @staticmethod
+    def available() -> bool:
+        return shutil.which("ffmpeg") is not None
+
+    def submit(self, path: str) -> Future:
+        """ Schedules the processing of the downloaded file in {path}.
+        The returned future results in the path of the processed file """
+
+        future = self.executor.submit(self.process, path)
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    def process(self, path: str) -> str:
+        with metrics.phase("postprocess", video=os.path.basename(path)):
+            if self.remux:
+                path = self.convert(path)
+            if self.thumbnail:
+                self.extract_thumbnail(path)
+        return path
+
+    def convert(self, path: str) -> str:
+        """ Rewrites {path} as an mp4, re-encoding its video if asked to,
+        and returns the path of the new file """
+
+        final_path = os.path.splitext(path)[0] + ".mp4"
+        part_path = final_path + ".part"
+        if self.reencode:
+            codec = ["-c:v", ENCODERS[self.reencode], "-c:a", "copy"]
+        else:
+            codec = ["-c", "copy"]
+        self.logger.info(f"Converting {path} into {final_path}")
+        try:
+            self.run(["-i", path, *codec, "-movflags",
+                     "+faststart", "-f", "mp4", part_path])
+        except PostProcessError:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            raise
+        os.replace(part_path, final_path)
+        if path != final_path:
+            os.remove(path)
+        return final_path
+
+    def extract_thumbnail(self, path: str) -> None:
+        thumbnail_path = os.path.splitext(path)[0] + ".jpg"
+        self.logger.info(f"Extracting the thumbnail of {path}")
+        self.run(["-i", path, "-vf", "thumbnail",
+                 "-frames:v", "1", thumbnail_path])
+
+    def run(self, args: list[str]) -> None:
+        try:
+            subprocess.run(["ffmpeg", "-y", "-v", "error", "-nostdin", *args],
+                           capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise PostProcessError(
+                f"ffmpeg failed on {args[1]}: {e.stderr.strip()}") from e
+        except OSError as e:
+            raise PostProcessError(f"Can't run ffmpeg: {e}") from e
+
+    def close(self, wait: bool = True) -> None:
+        """ Waits for the files submitted to be processed, unless {wait}
+        is False: then the ones not being processed yet are dropped """
+
+        if not wait:
+            for future in list(self.futures):
+                future.cancel()
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self) -> PostProcessor:
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        # an interrupted run doesn't wait for the queued files
+        self.close(wait=exc_type is None)
@@ -0,0 +1,143 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+import logging
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+import urllib.parse
+
+from .metrics import metrics
+
+T = TypeVar("T")
+# (connect, read) seconds after which a stalled request fails, so that
+# it can be retried instead of blocking forever
+REQUEST_TIMEOUT = (10, 30)
+
+
+def is_transient(error: Exception) -> bool:
+    """ Returns whether the request which raised {error} may succeed if
+    tried again: network errors and server side HTTP errors are, while
+    client side ones and malformed URLs aren't """
+
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code >= 500 or response.status_code == 429
+    # the requests exceptions are OSErrors, the ones about invalid
+    # URLs are ValueErrors too
+    return isinstance(error, OSError) and not isinstance(error, ValueError)
+
+
+class CircuitBreaker:
+    """ Keeps track of the consecutive failures of each host: after
+    {threshold} of them, the requests to the host are held back for
+    {cooldown} seconds, and then let through again one at a time until
+    one of them succeeds """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}
+        self.open_until = {}
+        self.condition = threading.Condition()
+
+    def wait(self, host: str) -> None:
+        """ Waits until requests to {host} are allowed """
+
+        with self.condition:
+            while True:
+                remaining = self.open_until.get(host, 0) - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            if self.failures.get(host, 0) >= self.threshold:
+                # half open: the next requests wait for this one
+                self.open_until[host] = time.monotonic() + self.cooldown
+
+    def success(self, host: str) -> None:
+        with self.condition:
+            self.failures.pop(host, None)
+            if self.open_until.pop(host, None) is not None:
+                self.condition.notify_all()
+
+    def failure(self, host: str) -> None:
+        with self.condition:
+            failures = self.failures.get(host, 0) + 1
+            self.failures[host] = failures
+            if failures == self.threshold:
+                self.logger.warning(
+                    f"Too many failures from {host}, pausing its requests for {self.cooldown:.0f} seconds")
+            if failures >= self.threshold:
+                self.open_until[host] = time.monotonic() + self.cooldown
+
+
+class Retrier:
+    """ Process-wide retry policy of the requests: transient failures are
+    retried up to {retries} times, waiting an exponentially growing,
+    jittered, delay starting from {backoff} seconds, while the circuit
+    breaker pauses the requests to hosts which keep failing """
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.setup()
+
+    def setup(self, retries: int = 3, backoff: float = 1.0, max_backoff: float = 60.0, breaker: CircuitBreaker | None = None) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    def delay(self, attempt: int) -> float:
+        # "equal jitter": retries of concurrent requests which failed
+        # together don't hit the server together again
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def call(self, url: str, function: Callable[[], T]) -> T:
+        """ Returns the result of {function}, which makes a request to
+        {url}, calling it again whenever it fails transiently """
+
+        host = urllib.parse.urlparse(url).netloc
+        attempt = 0
+        while True:
+            self.breaker.wait(host)
+            try:
+                result = function()
+            except Exception as e:
+                if not is_transient(e):
+                    # the host did answer
+                    self.breaker.success(host)
+                    raise
+                self.breaker.failure(host)
+                if attempt >= self.retries:
+                    raise
+                delay = self.delay(attempt)
+                attempt += 1
+                self.logger.info(
+                    f"Retrying {url} in {delay:.1f} seconds ({attempt}/{self.retries}): {e}")
+                metrics.add("retries")
+                time.sleep(delay)
+                continue
+            self.breaker.success(host)
+            return result
+
+
+retrier = Retrier()
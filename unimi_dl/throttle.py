@@ -0,0 +1,136 @@
+# Copyright (C) 2021 Alessandro Clerici Lorenzini and Zhifan Chen.
+#
+# This file is part of unimi-dl.
+#
+# unimi-dl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# unimi-dl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with unimi-dl.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+import logging
+import threading
+import time
+
+_units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(rate: str) -> int:
+    """ Returns the bytes/s expressed by {rate}, e.g. "500K" or "2.5M" """
+
+    rate = rate.strip().upper().rstrip("B")
+    unit = rate[-1:] if rate[-1:] in _units else ""
+    value = float(rate[:len(rate) - len(unit)])
+    if value <= 0:
+        raise ValueError("the rate must be positive")
+    return int(value * _units[unit])
+
+
+def format_size(amount: float) -> str:
+    """ Returns {amount} bytes in the units understood by {parse_rate} """
+
+    for unit in ["", "K", "M"]:
+        if amount < 1024:
+            return f"{amount:.1f} {unit}B"
+        amount /= 1024
+    return f"{amount:.1f} GB"
+
+
+class TokenBucket:
+    """ Rate limiter shared by every transfer of the process: each of
+    them consumes tokens for the bytes it receives, and waits when there
+    are none left, so that their aggregate rate stays below {rate} """
+
+    def __init__(self, rate: int, burst: int | None = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.last) * self.rate)
+            self.last = now
+            # the tokens can go negative: the debt is paid by waiting,
+            # both by this transfer and by the next ones
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ConcurrencyController:
+    """ Bounds the number of concurrent transfers, adapting the bound to
+    the aggregate throughput and error rate measured every {interval}
+    seconds: the bound keeps moving in the same direction while the
+    throughput improves, turns back when it doesn't, and is halved when
+    too many transfers fail, which usually means the server is
+    throttling us """
+
+    def __init__(self, maximum: int, minimum: int = 1, interval: float = 2.0, max_error_rate: float = 0.1) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.maximum = maximum
+        self.minimum = minimum
+        self.interval = interval
+        self.max_error_rate = max_error_rate
+        self.limit = max(minimum, maximum // 2)
+        self.direction = 1
+        self.active = 0
+        self.condition = threading.Condition()
+        self.last_throughput = None
+        self.reset_window()
+
+    def reset_window(self) -> None:
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+        self.window_transfers = 0
+        self.window_errors = 0
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, transferred: int, error: bool = False) -> None:
+        with self.condition:
+            self.active -= 1
+            self.window_bytes += transferred
+            self.window_transfers += 1
+            self.window_errors += error
+            self.adapt()
+            self.condition.notify_all()
+
+    def adapt(self) -> None:
+        elapsed = time.monotonic() - self.window_start
+        if elapsed < self.interval:
+            return
+        throughput = self.window_bytes / elapsed
+        error_rate = self.window_errors / self.window_transfers
+        if error_rate > self.max_error_rate:
+            limit = self.limit // 2
+            self.direction = 1
+        elif self.last_throughput is None or throughput > self.last_throughput * 1.05:
+            limit = self.limit + self.direction
+        else:
+            self.direction = -self.direction
+            limit = self.limit + self.direction
+        limit = min(self.maximum, max(self.minimum, limit))
+        if limit != self.limit:
+            self.logger.debug(
+                f"{throughput:.0f} B/s, {error_rate:.0%} errors: {self.limit} -> {limit} concurrent transfers")
+        self.limit = limit
+        self.last_throughput = throughput
+        self.reset_window()